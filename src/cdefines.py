@@ -9,6 +9,7 @@ to generate C-Header files that define all variables.
 
 from warnings import warn
 from os.path import join
+from poutput import replaceFile
 
 
 __author__ = 'Manuel Huber'
@@ -27,11 +28,13 @@ def generateHeader(mod, dst, cfgdict):
     :param dst:     Destination path of the output directory.
     :param cfgdict: A dictionary that contains all variables
                     that should be added to the C-Header file.
+    :returns:       True if the file has been written, False if it
+                    already existed with the same content.
     """
     modpath = join(dst, mod.relativepath())
     path = join(modpath, _HEADER_FILE % mod.uniquename())
     
-    with open(path, 'w') as f:
-        for key, value in cfgdict.items():
-            f.write(_DEFINE_LINE % (key, str(value)))
+    lines = [_DEFINE_LINE % (key, str(value))
+     for (key, value) in cfgdict.items()]
+    return replaceFile(path, "".join(lines))
 
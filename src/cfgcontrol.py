@@ -53,10 +53,31 @@ class ConfigController(object):
         self._cur_node = None
         self._cur_value = None
         self._apply = False
+        self._rows = dict()
+        # Maps the nodes of the current module to their index.
+        self._touched = set()
+        self._relayout = False
     
     def mainloop(self):
-        self._gui.mainloop()
+        try:
+            # Only registered while the gui is running (the listeners
+            # are global).
+            pmodules.addChangeListener(self._nodes_changed)
+            self._gui.mainloop()
+        finally:
+            pmodules.removeChangeListener(self._nodes_changed)
         return self._apply
+    
+    def _nodes_changed(self, nodes, modules):
+        """Collects changes (see pmodules.addChangeListener).
+        
+        They will be pushed to the gui by `_do_update`.
+        """
+        if self._cur_mod is None:
+            return
+        self._touched.update(nodes)
+        if self._cur_mod in modules:
+            self._relayout = True
         
     
     # called by gui:
@@ -108,11 +129,23 @@ class ConfigController(object):
             self._cur_node = None
             self._cur_mod = mod
             self._gui.setModuleHelp(mod.dumpsInfo())
-            names = mod.getNodeNames()
+            names = self._set_rows()
             colors = tuple(self.iterColors(names))
             self._gui.initNodes(names, colors)
             self._do_update()
     
+    def _set_rows(self):
+        """Takes over the nodes of the current module.
+        
+        :returns: Names of all nodes of the current module.
+        """
+        names = self._cur_mod.getNodeNames()
+        self._rows = dict((self._cur_mod.getNode(name, False), i)
+         for (i, name) in enumerate(names))
+        self._touched = set()
+        self._relayout = False
+        return names
+    
     def chooseNode(self, name):
         #self.applyChoice()
         node = self._cur_mod.getNode(name)
@@ -132,20 +165,31 @@ class ConfigController(object):
         return ret
     
     def _do_update(self):
+        """Executes frames and pushes the changes to the gui.
         
+        If nodes have been added or removed, the whole node list will
+        be updated, else only the colors of nodes that have been
+        touched (see `_nodes_changed`).
+        """
         if self._cur_mod is not None:
             self._cur_mod.executeFrames()
-            names = self._cur_mod.getNodeNames()
-            if self._cur_node is not None:
-                name = self._cur_node.getName()
-                self._cur_node = None
-                for (i, v) in enumerate(names):
-                    if v == name:
-                        default_index = i
-                        self._cur_node = self._cur_mod.getNode(v, False)
-            colors = tuple(self.iterColors(names))
-            print("bad _do_update")
-            self._gui.updateNodes(names, colors)
+            if self._relayout:
+                names = self._set_rows()
+                if self._cur_node is not None:
+                    name = self._cur_node.getName()
+                    self._cur_node = None
+                    if name in names:
+                        self._cur_node = self._cur_mod.getNode(name
+                         , False)
+                colors = tuple(self.iterColors(names))
+                self._gui.updateNodes(names, colors)
+            else:
+                rows = dict((self._rows[i], i.getName())
+                 for i in self._touched if i in self._rows)
+                self._touched = set()
+                if len(rows) > 0:
+                    self._gui.updateNodeColors(dict(zip(rows
+                     , self.iterColors(rows.values()))))
     
     def _real_apply(self):
         if None not in (self._cur_mod, self._cur_node, self._cur_value):
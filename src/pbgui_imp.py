@@ -28,6 +28,193 @@ __license__ = 'GPLv3'
 __docformat__ = "restructuredtext en"
 
 
+_WHEEL_ROWS = 3
+# Number of rows scrolled by one step of the mouse wheel.
+
+
+class VirtualList(object):
+    """Shows a (long) list in a Listbox.
+    
+    Only the rows that are visible will be materialised in the
+    Listbox, the scrollbar is driven by this class. All items,
+    colors and the selection are kept here (indices always refer to
+    the whole list). Rows will only be touched if their text, color
+    or selection has changed, so updating the colors of a list with
+    thousands of items only changes a few visible rows.
+    """
+    
+    def __init__(self, listbox, scrollbar):
+        """Initializes a new instance.
+        
+        :param listbox:   The Listbox that shows the visible rows.
+        :param scrollbar: The (vertical) Scrollbar of *listbox*.
+        """
+        self._lb = listbox
+        self._scl = scrollbar
+        self._items = tuple()
+        self._colors = None
+        self._selected = set()
+        self._offset = 0
+        self._shown = list()
+        # Text and color of each materialised row.
+        
+        self._lb.configure(yscrollcommand='')
+        self._scl.configure(command=self.yview)
+        self._lb.bind('<Configure>', lambda event: self.render())
+        self._lb.bind('<MouseWheel>', self._wheel_event_handler)
+        self._lb.bind('<Button-4>', self._wheel_event_handler)
+        self._lb.bind('<Button-5>', self._wheel_event_handler)
+    
+    def _visible_rows(self):
+        """Returns the number of rows that fit into the Listbox.
+        """
+        height = self._lb.winfo_height()
+        if height <= 1:
+            # Not mapped yet.
+            return int(self._lb.cget('height'))
+        linespace = int(self._lb.tk.call('font', 'metrics'
+         , self._lb.cget('font'), '-linespace'))
+        return height // max(1, linespace) + 1
+    
+    def _single(self):
+        return self._lb.cget('selectmode') in ('single', 'browse')
+    
+    def setItems(self, items, colors=None, selected=None, keep=False):
+        """Sets the items of the list.
+        
+        :param items:    Sequence of strings.
+        :param colors:   Optional sequence of colors (same length as
+                         *items*).
+        :param selected: Optional indices of all selected items.
+        :param keep:     If set, the scroll position will be kept
+                         and (if *selected* isn't set) so will the
+                         selection of items that are still there.
+        """
+        if selected is None:
+            selected = ()
+            if keep:
+                values = set(self._items[i] for i in self._selected)
+                selected = [i for (i, v) in enumerate(items)
+                 if v in values]
+        if not keep:
+            self._offset = 0
+        self._items = tuple(items)
+        self._colors = colors
+        self._selected = set(i for i in selected if i is not None)
+        self.render()
+    
+    def setColors(self, changes):
+        """Changes the colors of some items.
+        
+        :param changes: Dictionary that maps indices to colors.
+        """
+        if self._colors is None:
+            self._colors = [None] * len(self._items)
+        elif not isinstance(self._colors, list):
+            self._colors = list(self._colors)
+        for (index, color) in changes.items():
+            self._colors[index] = color
+        self.render()
+    
+    def getItem(self, index):
+        """Returns the item at *index* (of the whole list).
+        """
+        return self._items[index]
+    
+    def selection(self):
+        """Returns the sorted indices of all selected items.
+        """
+        return sorted(self._selected)
+    
+    def syncSelection(self):
+        """Takes over the selection of the visible rows.
+        
+        Has to be called if the user has changed the selection
+        (<<ListboxSelect>>).
+        """
+        cur = set(self._offset + int(i) for i in self._lb.curselection())
+        if self._single() and len(cur) > 0:
+            self._selected = set([min(cur)])
+            return
+        for i in range(self._offset, self._offset + len(self._shown)):
+            if i in cur:
+                self._selected.add(i)
+            else:
+                self._selected.discard(i)
+    
+    def see(self, index):
+        """Scrolls the list so that *index* is visible.
+        """
+        rows = self._visible_rows()
+        if index < self._offset:
+            self._offset = index
+        elif index >= self._offset + rows - 1:
+            self._offset = index - rows + 2
+        self.render()
+    
+    def yview(self, *args):
+        """Scrolls the list (command of the scrollbar).
+        """
+        if args[0] == 'moveto':
+            self._offset = int(round(float(args[1]) * len(self._items)))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= max(1, self._visible_rows() - 2)
+            self._offset += step
+        self.render()
+    
+    def _wheel_event_handler(self, event):
+        if event.num == 4 or event.delta > 0:
+            self._offset -= _WHEEL_ROWS
+        else:
+            self._offset += _WHEEL_ROWS
+        self.render()
+        return 'break'
+    
+    def render(self):
+        """Updates the visible rows and the scrollbar.
+        """
+        rows = self._visible_rows()
+        total = len(self._items)
+        self._offset = max(0, min(self._offset, total - rows + 1))
+        rows = max(0, min(rows, total - self._offset))
+        
+        if len(self._shown) > rows:
+            self._lb.delete(rows, tkinter.END)
+            del self._shown[rows:]
+        
+        for row in range(rows):
+            index = self._offset + row
+            text = self._items[index]
+            color = None
+            if self._colors is not None:
+                color = self._colors[index]
+            if row >= len(self._shown):
+                self._lb.insert(tkinter.END, text)
+                self._shown.append((text, None))
+            elif self._shown[row][0] != text:
+                self._lb.delete(row)
+                self._lb.insert(row, text)
+                self._shown[row] = (text, None)
+            if (color is not None) and (self._shown[row][1] != color):
+                self._lb.itemconfig(row, foreground=color)
+                self._shown[row] = (text, color)
+            
+            selected = (index in self._selected)
+            if selected != bool(self._lb.selection_includes(row)):
+                if selected:
+                    self._lb.selection_set(row)
+                else:
+                    self._lb.selection_clear(row)
+        
+        if total == 0:
+            self._scl.set(0.0, 1.0)
+        else:
+            self._scl.set(self._offset / total
+             , (self._offset + rows) / total)
+
+
 class Pbgui(CustomPbgui):
     
     def __init__(self, controller):
@@ -47,8 +234,9 @@ class Pbgui(CustomPbgui):
         root.bind("<<ListboxSelect>>", self._listbox_event_handler)
         root.bind("<KeyRelease>", self._testbox_event_handler)
         self._sclModules["command"] = self._lsModules.yview
-        self._sclNodes["command"] = self._lsNodes.yview
-        self._sclListconfig["command"] = self._lsListconfig.yview
+        self._vlNodes = VirtualList(self._lsNodes, self._sclNodes)
+        self._vlListconfig = VirtualList(self._lsListconfig
+         , self._sclListconfig)
         self._sclTextconfig["command"] = self._txTextconfig.yview
         self._labModules.config(text="                          ")
         self._labNodes.config(text="                          ")
@@ -100,9 +288,6 @@ class Pbgui(CustomPbgui):
     def _lsListconfig_selected(self, choice):
         self._ctrl.setChoice(choice)
     
-    def _int_list(self, str_list):
-        return tuple((int(i) for i in str_list))
-    
     def _listbox_event_handler(self, event):
         """Will be called by the <<ListboxSelect>> virtual event.
         
@@ -113,22 +298,18 @@ class Pbgui(CustomPbgui):
             cur_module = None
         else:
             cur_module = self._lsModules.get(cur_module)
-            
-        cur_node = self._lsNodes.curselection()
-        if len(cur_node) != 1:
-            cur_node = None
-        else:
-            cur_node = self._lsNodes.get(cur_node)
-        
-        cur_option = self._int_list(self._lsListconfig.curselection())
         
         if event.widget is self._lsModules:
             if cur_module is not None:
                 self._lsModules_selected(cur_module)
         elif event.widget is self._lsNodes:
-            if cur_node is not None:
-                self._lsNodes_selected(cur_node)
+            self._vlNodes.syncSelection()
+            cur_node = self._vlNodes.selection()
+            if len(cur_node) == 1:
+                self._lsNodes_selected(self._vlNodes.getItem(cur_node[0]))
         elif event.widget is self._lsListconfig:
+            self._vlListconfig.syncSelection()
+            cur_option = tuple(self._vlListconfig.selection())
             print("curr options", cur_option)
             self._lsListconfig_selected(cur_option)
     
@@ -146,7 +327,7 @@ class Pbgui(CustomPbgui):
         :param names: Module names that will be shown in list.
         """
         self._reset_listbox(self._lsModules)
-        self._reset_listbox(self._lsNodes)
+        self._vlNodes.setItems(())
         self._reset_config()
         for mod_name in names:
             self._lsModules.insert(tkinter.END, mod_name)
@@ -162,40 +343,29 @@ class Pbgui(CustomPbgui):
                        container has to be the same as the size 
                        of *nodes*
         """
-        self._reset_listbox(self._lsNodes)
         self._reset_config()
-        
-        for index in range(len(nodes)):
-            self._lsNodes.insert(tkinter.END, nodes[index])
-            self._lsNodes.itemconfig(str(index)
-                 , foreground=colors[index])
+        self._vlNodes.setItems(nodes, colors)
     
     def updateNodes(self, nodes, colors):
         """Updates nodes list and colors (_lsNodes).
         
+        Only visible rows whose name or color has changed will be
+        updated. The selected node stays selected.
+        
         :param nodes:  List of current nodes that shall be shown.
         :param colors: Colors of all nodes. The size of this iterable 
                        container has to be the same as the size 
                        of *nodes*
         """
-        cur_node = self._lsNodes.curselection()
-        
-        elm = self._lsNodes.get("0", tkinter.END)
-        max = len(elm) - 1
-        for (i, v) in enumerate(reversed(elm)):
-            if v not in nodes:
-                self._lsNodes.delete(str(max - i))
-        
-        for v in nodes:
-            if v not in elm:
-                self._lsNodes.insert(tkinter.END, v)
-        
-        elm = self._lsNodes.get("0", tkinter.END)
+        self._vlNodes.setItems(nodes, colors, keep=True)
+    
+    def updateNodeColors(self, colors):
+        """Changes the colors of some nodes (_lsNodes).
         
-        for (i, v) in enumerate(elm):
-            ci = nodes.index(v)
-            self._lsNodes.itemconfig(str(i)
-                 , foreground=colors[ci])
+        :param colors: Dictionary that maps the indices of nodes
+                       (see `initNodes`) to their new colors.
+        """
+        self._vlNodes.setColors(colors)
     
     def _reset_listbox(self, lstbox):
         lstbox.selection_clear("0", tkinter.END)
@@ -204,7 +374,8 @@ class Pbgui(CustomPbgui):
     def _reset_config(self):
         self._txTextconfig.config(state='normal')
         self._txTextconfig.delete("1.0", tkinter.END)
-        self._reset_listbox(self._lsListconfig)
+        self._lsListconfig.config(state='normal')
+        self._vlListconfig.setItems(())
         self._lsListconfig.config(state='disabled')
         self._txTextconfig.config(state='disabled')
         self._butApply.config(state='disabled')
@@ -214,10 +385,6 @@ class Pbgui(CustomPbgui):
         self._butApply.config(state='normal')
         self._butReset.config(state='normal')
     
-    def _copy_config_list(self, lst):
-        for elm in lst:
-            self._lsListconfig.insert(tkinter.END, elm)
-    
     def setModuleHelp(self, text):
         """Just sets text of _labModules control.
         
@@ -281,9 +448,9 @@ class Pbgui(CustomPbgui):
         self._reset_config()
         self._enable_config_buttons()
         self._lsListconfig.config(state='normal', selectmode='single')
-        self._copy_config_list(lst)
+        self._vlListconfig.setItems(lst, selected=[choice])
         if choice is not None:
-            self._lsListconfig.selection_set(str(choice))
+            self._vlListconfig.see(choice)
     
     def setMultiNode(self, lst, choice):
         """Sets up the gui to allow the user to choose multiple values.
@@ -297,10 +464,7 @@ class Pbgui(CustomPbgui):
         self._reset_config()
         self._enable_config_buttons()
         self._lsListconfig.config(state='normal', selectmode='multiple')
-        self._copy_config_list(lst)
-        if choice is not None:
-            for index in choice:
-                self._lsListconfig.selection_set(str(index))
+        self._vlListconfig.setItems(lst, selected=choice)
     
     def mainloop(self):
         """Runs the tk event loop
@@ -8,16 +8,19 @@ of (f.e.) a C Project.
 """
 
 from optparse import OptionParser
+from ast import literal_eval
 import sys
 import os
 import glob
+import contextlib
 import logging
-from pbgui_imp import Pbgui
 import pfile
 import targets
 import pmodules
 import cfgcontrol
 import cdefines
+import poutput
+import peval
 
 
 __author__ = 'Manuel Huber'
@@ -35,8 +38,19 @@ _PCDIR = '.pconfig'
 
 _PCMAIN = 'main.jso'
 _PC_CCF = 'current-config.jso'
+_PC_MANIFEST = 'manifest.jso'
+_PC_CACHE = 'cache'
+_PC_TEMPLATE_CACHE = 'templates'
+_PC_SCRIPT_CACHE = 'scripts'
+_PC_DISCOVERY = 'discovery.jso'
+_PC_SOCKET = 'daemon.sock'
+_PC_LOCK = 'lock'
+_PC_BACKUPS = 1
+# Number of backups kept of the main config and the current config.
 _DEFAULT_SRC = './src/'
 _DEFAULT_DST = './out/'
+_MATRIX_SUFFIX = '.matrix'
+# Default output directory of 'make --matrix' is dst + _MATRIX_SUFFIX.
 
 _DEFAULT_LOG_FORMAT = "%(name)s : %(threadName)s : %(levelname)s \
 : %(message)s"
@@ -56,7 +70,16 @@ picklebuild commands:
   cfg:    Shows the configure window. Normally, the current config 
           will be used. If you press ok, it will be saved to current 
           config, if you press cancle it won't be saved.
-  make:   This command will finally generate output."""
+  set:    Changes node values without starting the gui (f.e.
+          'set MODULE.NODE=value' or 'set -f overlay.jso') and
+          saves the current config.
+  make:   This command will finally generate output.
+  serve:  Starts a daemon that keeps all modules loaded, watches
+          the source tree and the current config and builds on
+          request ('watch' also builds after each change).
+  build:  Tells the daemon to build the output directory.
+  convert: Converts a config file between json and the (faster)
+          binary snapshot format."""
 
 _CMD_DESC = """You can always use the --help option on each
 command to get a more specific help."""
@@ -115,6 +138,7 @@ class MainConfig(object):
         self._real_init(cwd)
         self.source = None
         self.dest = None
+        self.ignore = list()
         if autoload or failinpc:
             self.loadConfig()
         if failinpc and (not self.isProperlyConfigured()):
@@ -218,6 +242,7 @@ class MainConfig(object):
         except AttributeError:
             print("bad attribute error")
             raise
+        cfg['ignore'] = getattr(obj, 'ignore', None)
         return self.setup(cfg, cwd=cwd)
     
     def setup(self, cfg, cwd=None, fail=True):
@@ -252,6 +277,8 @@ class MainConfig(object):
                  , default=self.source)
             self.dest = _get_nn(cfg.pop('dst', None)
                  , default=self.dest)
+            self.ignore = list(_get_nn(cfg.pop('ignore', None)
+                 , default=self.ignore))
             
             if None in (self.source, self.dest):
                 if fail:
@@ -313,6 +340,7 @@ class MainConfig(object):
             cfg = dict()
             cfg['src'] = self.source
             cfg['dst'] = self.dest
+            cfg['ignore'] = self.ignore
             if not leave_tgl:
                 cfg['tgl'] = list(self.targets.iterNames())
             else:
@@ -321,7 +349,7 @@ class MainConfig(object):
                     cfg['tgl'] = list()
                 else:
                     cfg['tgl'] = old.pop('tgl', list())
-            pfile.saveControlFile(path, cfg)
+            pfile.saveControlFile(path, cfg, backups=_PC_BACKUPS)
     
     def _load_config(self):
         if self.foundConfig():
@@ -353,6 +381,31 @@ def _expand_all(args):
             yield i
 
 
+def _project_lock(cfg=None, shared=False):
+    """Creates the lock of the config dir of a project.
+    
+    Parallel invocations (f.e. in CI) will wait for each other
+    instead of corrupting the files in the config dir. Commands
+    only hold it while they load or save files (not while the gui
+    is shown).
+    
+    :param cfg:    The MainConfig of the project (if not set, the
+                   project of the current directory will be used).
+    :param shared: If set, only a shared (read) lock will be used.
+    :returns:      pfile.FileLock instance (or a dummy context
+                   manager if there is no project yet).
+    """
+    def waiting(path):
+        print("Waiting for lock '%s'." % path, file=sys.stderr)
+    
+    if cfg is None:
+        cfg = MainConfig(os.getcwd(), autoload=False)
+    if not cfg.foundConfig():
+        return contextlib.nullcontext()
+    return pfile.FileLock(os.path.join(cfg.config_dir, _PC_LOCK)
+     , shared=shared, waiting=waiting)
+
+
 def add(parser, args):
     parser.usage="usage: %prog add [options] files"
     options, args = parser.parse_args(args)
@@ -360,10 +413,11 @@ def add(parser, args):
     if len(args) < 1:
         parser.print_help(file=sys.stderr)
     else:
-        cfg = MainConfig(os.getcwd(), failinpc=True)
-        for i in _expand_all(args):
-            cfg.addTarget(i)
-        cfg.saveConfig()
+        with _project_lock():
+            cfg = MainConfig(os.getcwd(), failinpc=True)
+            for i in _expand_all(args):
+                cfg.addTarget(i)
+            cfg.saveConfig()
         cfg.targets.dumpTree()
 
 def rm(parser, args):
@@ -373,10 +427,11 @@ def rm(parser, args):
     if len(args) < 1:
         parser.print_help(file=sys.stderr)
     else:
-        cfg = MainConfig(os.getcwd(), failinpc=True)
-        for i in _expand_all(args):
-            cfg.rmTarget(i)
-        cfg.saveConfig()
+        with _project_lock():
+            cfg = MainConfig(os.getcwd(), failinpc=True)
+            for i in _expand_all(args):
+                cfg.rmTarget(i)
+            cfg.saveConfig()
         cfg.targets.dumpTree()
 
 def setup(parser, args):
@@ -392,11 +447,16 @@ def setup(parser, args):
     parser.add_option("-o", "--override", action="store_true"
      , help="This flag has to be attached, to enable change directory"
      , default=False)
+    parser.add_option("-x", "--ignore", action="append", dest="ignore"
+     , help="Directories matching this pattern (name or relative "
+     + "path) won't be searched for modules. Can be used more than "
+     + "once (replaces all patterns).")
     options, args = parser.parse_args(args)
     
     cfg = MainConfig(os.getcwd(), autoload=False)
     
-    dir_nn = (options.src is not None) or (options.dst is not None)
+    dir_nn = ((options.src is not None) or (options.dst is not None)
+     or (options.ignore is not None))
     
     if cfg.foundConfig():
         if options.show:
@@ -406,15 +466,17 @@ def setup(parser, args):
             if cfg.isProperlyConfigured():
                 print("source: ", cfg.source)
                 print("dest: ", cfg.dest)
+                print("ignore: ", cfg.ignore)
                 print("Everything properly set up.")
             else:
                 print("source: ", cfg.source)
                 print("dest: ", cfg.dest)
                 print("Not correctly set up.")
         elif dir_nn and options.override:
-            cfg.loadConfig(fail=False)
-            cfg.setupFromObject(options)
-            cfg.saveConfig(leave_tgl=True)
+            with _project_lock(cfg):
+                cfg.loadConfig(fail=False)
+                cfg.setupFromObject(options)
+                cfg.saveConfig(leave_tgl=True)
         elif dir_nn and (not options.override):
             print("you have to add --override to reconfigure.")
         else:
@@ -428,31 +490,222 @@ def status(parser, args):
     parser.usage="usage: %prog status"
     options, args = parser.parse_args(args)
     
-    cfg = MainConfig(os.getcwd(), failinpc=True)
+    with _project_lock(shared=True):
+        cfg = MainConfig(os.getcwd(), failinpc=True)
     cfg.targets.dumpTree()
 
 
+def _gui_class():
+    """Imports the gui (only if it's really needed).
+    
+    Importing the gui imports tkinter, which isn't available
+    on every (headless) system.
+    
+    :returns: The gui class used by ConfigController.
+    """
+    from pbgui_imp import Pbgui
+    return Pbgui
+
+
+def _load_modules(cfg, cache=True):
+    """Creates a ModuleManager and searches all modules.
+    
+    :param cfg:   The MainConfig of the project.
+    :param cache: If set, compiled configure scripts will be saved
+                  in the cache directory and the discovery index will
+                  be used.
+    :returns:     The ModuleManager instance.
+    """
+    ccache = peval.CodeCache(None)
+    index = None
+    if cache:
+        ccache = peval.CodeCache(os.path.join(cfg.config_dir, _PC_CACHE
+         , _PC_SCRIPT_CACHE))
+        ipath = os.path.join(cfg.config_dir, _PC_CACHE, _PC_DISCOVERY)
+        index = pmodules.DiscoveryIndex.load(ipath, cfg.fullSource())
+    
+    man = pmodules.ModuleManager(cfg.fullSource(), ccache=ccache)
+    man.initModules(cfg.targets, ignore=cfg.ignore, index=index)
+    if index is not None:
+        index.save(ipath)
+    return man
+
+
 def configure(parser, args):
     parser.usage="usage: %prog configure"
     options, args = parser.parse_args(args)
     
-    cfg = MainConfig(os.getcwd(), failinpc=True)
-    man = pmodules.ModuleManager(cfg.fullSource())
-    man.initModules(cfg.targets)
-    path = os.path.join(cfg.config_dir, _PC_CCF)
-    config = dict()
-    if os.path.isfile(path):
-        config = pfile.loadConfigFile(path)
-    else:
-        logging.warning("Default configuration does not exist")
-    man.loadNodes(config=config)
-    ctrl = cfgcontrol.ConfigController(Pbgui, man)
+    with _project_lock():
+        cfg = MainConfig(os.getcwd(), failinpc=True)
+        man = _load_modules(cfg)
+        path = os.path.join(cfg.config_dir, _PC_CCF)
+        config = dict()
+        if os.path.isfile(path):
+            config = pfile.loadConfigFile(path)
+        else:
+            logging.warning("Default configuration does not exist")
+        man.loadNodes(config=config)
+    ctrl = cfgcontrol.ConfigController(_gui_class(), man)
     save_settings = ctrl.mainloop()
     if save_settings:
         print("Is fully configured: "
              , man.isFullyConfigured(warning=True))
         print(man.collectConfig())
-        pfile.saveConfigFile(path, man.collectConfig())
+        with _project_lock(cfg):
+            pfile.saveConfigFile(path, man.collectConfig()
+             , backups=_PC_BACKUPS)
+
+
+def _parse_value(text):
+    """Converts a value given as text to a python object.
+    
+    Python literals (f.e. *True*, *3* or *['a', 'b']*) will be
+    evaluated, everything else will be used as string.
+    
+    :param text: The value as string.
+    :returns:    The converted value.
+    """
+    try:
+        return literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def _load_overlay(path):
+    """Loads a file of node values.
+    
+    Files ending with *.ini* or *.cfg* will be read as ini files
+    (one section per module), all other files have to be json files
+    using the same layout as the current config.
+    
+    :param path: Path to the overlay file.
+    :returns:    Dictionary that maps module names to dictionaries
+                 of node names and values.
+    """
+    if os.path.splitext(path)[1].lower() in ('.ini', '.cfg'):
+        import configparser
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.optionxform = str
+        parser.read(path)
+        return dict((section, dict((k, _parse_value(v))
+         for (k, v) in parser.items(section)))
+         for section in parser.sections())
+    return pfile.loadConfigFile(path)
+
+
+def _add_assignment(values, module, node, value):
+    
+    # Modules are identified by their (uppercase) unique name.
+    module = module.strip().upper()
+    values.setdefault(module, dict())[node] = value
+
+
+def apply(parser, args):
+    parser.usage="usage: %prog set [options] [MODULE.NODE=value ...]"
+    parser.add_option("-f", "--file", dest="files", action="append"
+     , default=[], help="Load node values from a json or ini file. "
+     + "Can be used more than once.")
+    parser.add_option("-l", "--load-config", dest="load"
+     , help="Config file that will be changed (default is the "
+     + "current config).")
+    parser.add_option("-o", "--output", dest="output"
+     , help="Save the config to this file (default is the file "
+     + "that has been loaded).")
+    options, args = parser.parse_args(args)
+    
+    values = dict()
+    for path in options.files:
+        for (module, nodes) in _load_overlay(path).items():
+            for (node, value) in nodes.items():
+                _add_assignment(values, module, node, value)
+    for arg in args:
+        (name, sep, value) = arg.partition('=')
+        (module, dot, node) = name.partition('.')
+        if not (sep and dot and module and node):
+            logging.error("Invalid assignment '%s' (expected "
+             "MODULE.NODE=value)." % arg)
+            return
+        _add_assignment(values, module, node, _parse_value(value))
+    
+    with _project_lock():
+        cfg = MainConfig(os.getcwd(), failinpc=True)
+        path = _get_nn(options.load, os.path.join(cfg.config_dir, _PC_CCF))
+        config = dict()
+        if os.path.isfile(path):
+            config = pfile.loadConfigFile(path)
+        elif options.load is not None:
+            logging.error("Couldn't find config-file '%s'." % path)
+            return
+        
+        # Nodes created by frames get their value when they are created.
+        for (module, nodes) in values.items():
+            config.setdefault(module, dict()).update(nodes)
+        
+        man = _load_modules(cfg)
+        man.loadNodes(config=config)
+        failed = man.setValues(values)
+        if len(failed) > 0:
+            for name in failed:
+                logging.error("Couldn't set '%s' (unknown node or "
+                 "invalid value)." % name)
+            print("Config has not been saved.")
+            return
+        
+        if not man.isFullyConfigured():
+            logging.warning("Not all nodes are configured.")
+        pfile.saveConfigFile(_get_nn(options.output, path)
+         , man.collectConfig(), backups=_PC_BACKUPS)
+
+
+def convert(parser, args):
+    parser.usage="usage: %prog convert [options] file [output]"
+    parser.add_option("-t", "--to", dest="fmt", type="choice"
+     , choices=pfile.FORMATS
+     , help="Format of the output file %s (default is the format "
+     % str(pfile.FORMATS) + "the input file isn't stored in).")
+    options, args = parser.parse_args(args)
+    
+    if len(args) not in (1, 2):
+        parser.print_help(file=sys.stderr)
+        return
+    
+    path = args[0]
+    if not os.path.isfile(path):
+        logging.error("Couldn't find file '%s'." % path)
+        return
+    fmt = options.fmt
+    if fmt is None:
+        fmt = pfile.FORMAT_SNAPSHOT
+        if pfile.fileFormat(path) == pfile.FORMAT_SNAPSHOT:
+            fmt = pfile.FORMAT_JSON
+    
+    output = args[-1]
+    with _project_lock():
+        pfile.saveConfigFile(output, pfile.loadConfigFile(path), fmt=fmt)
+    print("Written '%s' (%s)." % (output, fmt))
+
+
+def _add_build_options(parser):
+    """Adds the options that control how the output directory is built
+    (used by **make** and **serve**).
+    
+    :param parser: The OptionParser of the command.
+    """
+    parser.add_option("-c", "--create-c-headers", dest="cheaders"
+     , help="Indicates, that c-header files will be included."
+     , default=False, action="store_true")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int"
+     , help="Number of processes used to render targets (default 1)."
+     , default=1)
+    parser.add_option("--link", dest="link", type="choice"
+     , choices=poutput.LINK_STRATEGIES, default=poutput.LINK_COPY
+     , help="How files that aren't targets will be placed in the "
+     + "output directory %s (default %s)."
+     % (str(poutput.LINK_STRATEGIES), poutput.LINK_COPY))
+    parser.add_option("--no-cache", dest="cache"
+     , help="Don't use (or update) the cache of compiled targets, "
+     + "configure scripts and the module discovery index."
+     , default=True, action="store_false")
 
 
 def make(parser, args):
@@ -462,34 +715,46 @@ def make(parser, args):
      , default=True, action="store_false")
     parser.add_option("-l", "--load-config", dest="load"
      , help="Load a config file before starting build process.")
-    parser.add_option("-c", "--create-c-headers", dest="cheaders"
-     , help="Indicates, that c-header files will be included."
+    parser.add_option("-i", "--incremental", dest="incremental"
+     , help="Only copy and render files whose inputs have changed "
+     + "since the last build."
      , default=False, action="store_true")
+    _add_build_options(parser)
+    parser.add_option("-m", "--matrix", dest="matrix"
+     , help="Build every config file (*.jso) of this directory. Each "
+     + "one will be rendered to a sub-directory (named like the "
+     + "config file) of the matrix output directory.")
+    parser.add_option("--matrix-out", dest="matrix_out"
+     , help="Output directory of --matrix builds (default is the "
+     + "output directory with '%s' appended)." % _MATRIX_SUFFIX)
     options, args = parser.parse_args(args)
     
-    cfg = MainConfig(os.getcwd(), failinpc=True)
-    
-    if options.load is None:
-        path = os.path.join(cfg.config_dir, _PC_CCF)
-        if not os.path.isfile(path):
-            logging.debug("No 'current config' exists yet.")
-    else:
-        path = options.load
-        if not os.path.isfile(path):
-            logging.error("Couldn't find config-file '%s'." % path)
-    
-    if os.path.isfile(path):
-        config = pfile.loadConfigFile(path)
-    else:
-        config = dict()
-    
-    man = pmodules.ModuleManager(cfg.fullSource())
-    man.initModules(cfg.targets)
-    man.loadNodes(config=config)
+    with _project_lock():
+        cfg = MainConfig(os.getcwd(), failinpc=True)
+        
+        if options.matrix is not None:
+            return _make_matrix(cfg, options)
+        
+        if options.load is None:
+            path = os.path.join(cfg.config_dir, _PC_CCF)
+            if not os.path.isfile(path):
+                logging.debug("No 'current config' exists yet.")
+        else:
+            path = options.load
+            if not os.path.isfile(path):
+                logging.error("Couldn't find config-file '%s'." % path)
+        
+        if os.path.isfile(path):
+            config = pfile.loadConfigFile(path)
+        else:
+            config = dict()
+        
+        man = _load_modules(cfg, cache=options.cache)
+        man.loadNodes(config=config)
     
     if options.interactive:
         while not man.isFullyConfigured():
-            ctrl = cfgcontrol.ConfigController(Pbgui, man)
+            ctrl = cfgcontrol.ConfigController(_gui_class(), man)
             if not ctrl.mainloop():
                 # User pressed the 'cancle' button.
                 print("exiting")
@@ -498,11 +763,166 @@ def make(parser, args):
     if not man.isFullyConfigured():
         return
     
+    with _project_lock(cfg):
+        touched = _generate(cfg, man, cfg.fullDestination(), options
+         , _template_cache(cfg, options)
+         , os.path.join(cfg.config_dir, _PC_MANIFEST))
+    print("%d file(s) written." % touched)
+
+
+def _template_cache(cfg, options):
+    
+    if options.cache:
+        return peval.TemplateCache(os.path.join(cfg.config_dir
+         , _PC_CACHE, _PC_TEMPLATE_CACHE))
+    return peval.TemplateCache(None)
+
+
+def _generate(cfg, man, dst, options, tcache, mpath):
+    """Generates the output directory (see *make*).
+    
+    :param cfg:     The MainConfig of the project.
+    :param man:     The ModuleManager (nodes have to be loaded).
+    :param dst:     The output directory.
+    :param options: Options of the make command.
+    :param tcache:  The peval.TemplateCache.
+    :param mpath:   Path of the manifest. It will be used if the
+                    build is incremental and saved after each build
+                    (so a later incremental build knows about all
+                    files written by a full one).
+    :returns:       Number of files that have been written.
+    """
+    cbcfg = None
+    if options.cheaders:
+        cbcfg = cdefines.generateHeader
+    
+    if options.incremental:
+        manifest = poutput.BuildManifest.load(mpath, dst)
+    else:
+        manifest = poutput.BuildManifest(dst)
+    
+    touched = man.generateOutput(dst, cbcfg=cbcfg, manifest=manifest
+     , tcache=tcache, jobs=options.jobs, link=options.link)
+    manifest.save(mpath)
+    return touched
+
+
+def _make_matrix(cfg, options):
+    """Builds all config files of a directory (make --matrix).
+    
+    Modules will only be discovered once and compiled scripts and
+    templates will be shared by all builds. Configs that aren't fully
+    configured will be skipped. Each config will be rendered to its
+    own directory below the matrix root (not the output directory,
+    so the files of normal builds never get mixed up with them).
+    
+    :param cfg:     The MainConfig of the project.
+    :param options: Options of the make command.
+    """
+    paths = sorted(glob.glob(os.path.join(options.matrix, '*.jso')))
+    if len(paths) == 0:
+        logging.error("Couldn't find any config file in '%s'."
+         % options.matrix)
+        return
+    
+    root = _get_nn(options.matrix_out
+     , cfg.fullDestination() + _MATRIX_SUFFIX)
+    man = _load_modules(cfg, cache=options.cache)
+    tcache = _template_cache(cfg, options)
+    skipped = list()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        man.loadNodes(config=pfile.loadConfigFile(path))
+        if not man.isFullyConfigured():
+            logging.error("Skipping '%s' (not fully configured)." % path)
+            skipped.append(name)
+            continue
+        
+        touched = _generate(cfg, man, os.path.join(root, name), options
+         , tcache, os.path.join(cfg.config_dir
+         , "%s.%s" % (name, _PC_MANIFEST)))
+        print("%s: %d file(s) written." % (name, touched))
+    
+    if len(skipped) > 0:
+        print("Skipped %d config(s): %s" % (len(skipped)
+         , ", ".join(skipped)))
+
+
+def serve(parser, args, auto=False):
+    parser.usage="usage: %prog serve|watch [options]"
+    parser.add_option("-w", "--watch", dest="auto"
+     , help="Build the output directory after each change."
+     , default=auto, action="store_true")
+    parser.add_option("-p", "--poll", dest="poll"
+     , help="Poll for changes (instead of using inotify)."
+     , default=False, action="store_true")
+    _add_build_options(parser)
+    options, args = parser.parse_args(args)
+    
+    import pdaemon
+    cfg = MainConfig(os.getcwd(), failinpc=True)
+    dst = cfg.fullDestination()
+    mpath = os.path.join(cfg.config_dir, _PC_MANIFEST)
+    tcache = _template_cache(cfg, options)
+    cbcfg = None
     if options.cheaders:
-        man.generateOutput(cfg.fullDestination()
-         , cbcfg=cdefines.generateHeader)
+        cbcfg = cdefines.generateHeader
+    
+    def load():
+        with _project_lock(cfg):
+            return _load_modules(MainConfig(cfg.base_dir, failinpc=True)
+             , cache=options.cache)
+    
+    def generate(man):
+        # 'make' may have changed dst (and the manifest) meanwhile.
+        with _project_lock(cfg):
+            manifest = poutput.BuildManifest.load(mpath, dst)
+            touched = man.generateOutput(dst, cbcfg=cbcfg
+             , manifest=manifest, tcache=tcache, jobs=options.jobs
+             , link=options.link)
+            manifest.save(mpath)
+        return touched
+    
+    watcher = pdaemon.createWatcher([cfg.fullSource()]
+     , [os.path.join(cfg.config_dir, _PC_CCF)
+     , os.path.join(cfg.config_dir, _PCMAIN)]
+     , exclude=[dst, cfg.config_dir], poll=options.poll)
+    server = pdaemon.BuildServer(load, generate
+     , os.path.join(cfg.config_dir, _PC_CCF)
+     , os.path.join(cfg.config_dir, _PCMAIN)
+     , os.path.join(cfg.config_dir, _PC_SOCKET), watcher
+     , auto=options.auto)
+    try:
+        server.serveForever()
+    except pdaemon.DaemonError as e:
+        logging.error(str(e))
+    except KeyboardInterrupt:
+        pass
+
+
+def build(parser, args):
+    parser.usage="usage: %prog build [options]"
+    parser.add_option("-s", "--status", dest="cmd"
+     , help="Show the status of the daemon instead of building."
+     , default='build', action="store_const", const='status')
+    parser.add_option("--stop", dest="cmd"
+     , help="Stop the daemon.", action="store_const", const='stop')
+    options, args = parser.parse_args(args)
+    
+    import pdaemon
+    cfg = MainConfig(os.getcwd(), failinpc=True)
+    try:
+        response = pdaemon.sendCommand(os.path.join(cfg.config_dir
+         , _PC_SOCKET), options.cmd)
+    except OSError as e:
+        logging.error("Couldn't connect to daemon (%s). Use 'serve' "
+         % str(e) + "to start it.")
+        return
+    
+    if response['ok']:
+        print(response['message'])
     else:
-        man.generateOutput(cfg.fullDestination())
+        logging.error(response['message'])
 
 
 def _set_level_callback(option, opt_str, value, parser, *args, **kgs):
@@ -549,6 +969,14 @@ def main(args, loglevel=logging.DEBUG):
             return make(parser, args[2:])
         elif cmd in ('cfg', 'config', 'configure'):
             return configure(parser, args[2:])
+        elif cmd in ('set', 'apply'):
+            return apply(parser, args[2:])
+        elif cmd in ('serve', 'watch'):
+            return serve(parser, args[2:], auto=(cmd == 'watch'))
+        elif cmd == 'build':
+            return build(parser, args[2:])
+        elif cmd == 'convert':
+            return convert(parser, args[2:])
     except IndexError:
         pass
     except SourceNotFoundError as e:
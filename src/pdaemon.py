@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module implements the build daemon (**serve** and **watch**).
+
+The daemon keeps the ModuleManager (and all compiled scripts and
+templates) in memory and watches the source tree and the current
+config file. If something changes, only the scripts of the affected
+modules will be executed again. Builds can be triggered by a client
+over a local unix socket (see `sendCommand`) or automatically after
+each change (watch mode).
+"""
+
+import os
+import json
+import time
+import errno
+import ctypes
+import socket
+import struct
+import logging
+import selectors
+import pfile
+import pmodules
+
+
+__author__ = 'Manuel Huber'
+__copyright__ = "Copyright (c) 2011 Manuel Huber."
+__license__ = 'GPLv3'
+__docformat__ = "restructuredtext en"
+
+_LOGGER_NAME = 'daemon'
+_POLL_INTERVAL = 1.0
+_SETTLE_TIME = 0.1
+# Time to wait for further events after a change has been detected
+# (editors usually write a file in several steps).
+_MAX_REQUEST_SIZE = 1 << 16
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM
+ | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE)
+_IN_EVENT = struct.Struct('iIII')
+# struct inotify_event (without the name).
+
+CMD_BUILD = 'build'
+CMD_STATUS = 'status'
+CMD_STOP = 'stop'
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _is_excluded(path, exclude):
+    """Checks if *path* is (inside) one of the *exclude* directories.
+    """
+    for i in exclude:
+        if path == i or path.startswith(i + os.sep):
+            return True
+    return False
+
+
+class PollingWatcher(object):
+    """Detects changes by comparing snapshots of all watched files.
+    
+    This is the fallback if inotify isn't available.
+    """
+    
+    def __init__(self, roots, files, exclude=(), interval=_POLL_INTERVAL):
+        """Initializes the watcher (and takes the first snapshot).
+        
+        :param roots:    Directories that will be watched recursively.
+        :param files:    Additional files to watch.
+        :param exclude:  Directories (inside *roots*) to skip.
+        :param interval: Seconds between two snapshots.
+        """
+        self._roots = [os.path.abspath(i) for i in roots]
+        self._files = [os.path.abspath(i) for i in files]
+        self._exclude = [os.path.abspath(i) for i in exclude]
+        self._interval = interval
+        self._snapshot = self._scan()
+    
+    def _stat(self, snapshot, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        snapshot[path] = (st.st_mtime_ns, st.st_size)
+    
+    def _scan(self):
+        snapshot = dict()
+        for root in self._roots:
+            for (dirpath, dirnames, filenames) in os.walk(root):
+                dirnames[:] = [i for i in dirnames if not _is_excluded(
+                    os.path.join(dirpath, i), self._exclude)]
+                for name in filenames:
+                    self._stat(snapshot, os.path.join(dirpath, name))
+        for path in self._files:
+            self._stat(snapshot, path)
+        return snapshot
+    
+    def fileno(self):
+        """There is nothing to select on (see `timeout`).
+        """
+        return None
+    
+    def timeout(self):
+        """Returns the time to wait until `changes` should be called.
+        """
+        return self._interval
+    
+    def changes(self):
+        """Returns all paths that have changed since the last call.
+        
+        :returns: Set of changed (or new or removed) paths.
+        """
+        old = self._snapshot
+        self._snapshot = self._scan()
+        changed = set(i for (i, state) in self._snapshot.items()
+         if old.get(i) != state)
+        changed.update(set(old) - set(self._snapshot))
+        return changed
+    
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Watches files with inotify (linux only).
+    
+    All directories below the roots will be watched. The additional
+    files are watched by watching their parent directories (so files
+    that are replaced by a rename will still be detected).
+    """
+    
+    def __init__(self, roots, files, exclude=()):
+        """Initializes inotify and adds all watches.
+        
+        :param roots:   Directories that will be watched recursively.
+        :param files:   Additional files to watch.
+        :param exclude: Directories (inside *roots*) to skip.
+        :raises OSError: If inotify isn't available.
+        """
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self._fd = -1
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify isn't available")
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        
+        self._exclude = [os.path.abspath(i) for i in exclude]
+        self._dirs = dict()
+        self._wds = dict()
+        self._trees = set()
+        self._files = dict()
+        try:
+            for root in roots:
+                self._watch_tree(os.path.abspath(root))
+            for path in files:
+                (dirname, name) = os.path.split(os.path.abspath(path))
+                self._files.setdefault(dirname, set()).add(name)
+                self._watch(dirname)
+        except OSError:
+            self.close()
+            raise
+    
+    def _watch(self, path):
+        """Adds a watch for a single directory.
+        
+        :returns: True if the watch has been added (False if the
+                  directory doesn't exist (anymore)).
+        """
+        if path in self._wds:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path)
+         , _IN_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return False
+            raise OSError(err, "%s (%s)" % (os.strerror(err), path))
+        self._dirs[wd] = path
+        self._wds[path] = wd
+        return True
+    
+    def _watch_tree(self, root):
+        """Watches *root* and all sub-directories.
+        
+        :returns: List of all files that have been found (they may
+                  have been created before the watch was added).
+        """
+        found = list()
+        for (dirpath, dirnames, filenames) in os.walk(root):
+            dirnames[:] = [i for i in dirnames if not _is_excluded(
+                os.path.join(dirpath, i), self._exclude)]
+            if self._watch(dirpath):
+                self._trees.add(dirpath)
+                found.extend(os.path.join(dirpath, i) for i in filenames)
+        return found
+    
+    def _forget(self, root):
+        """Removes the watches of *root* and all sub-directories.
+        """
+        for path in [i for i in self._trees if i == root
+         or i.startswith(root + os.sep)]:
+            self._trees.discard(path)
+            if path in self._files:
+                continue
+            wd = self._wds.pop(path)
+            del self._dirs[wd]
+            # Fails (harmlessly) if the directory has been deleted.
+            self._libc.inotify_rm_watch(self._fd, wd)
+    
+    def fileno(self):
+        """Returns the file descriptor to select on.
+        """
+        return self._fd
+    
+    def timeout(self):
+        """Returns None (the watcher doesn't have to be polled).
+        """
+        return None
+    
+    def _read(self):
+        data = b''
+        while True:
+            try:
+                block = os.read(self._fd, _MAX_REQUEST_SIZE)
+            except BlockingIOError:
+                break
+            if len(block) == 0:
+                break
+            data += block
+        return data
+    
+    def changes(self):
+        """Reads all pending events.
+        
+        :returns: Set of changed paths or None if events have been
+                  lost (then everything may have changed).
+        """
+        data = self._read()
+        changed = set()
+        offset = 0
+        while offset + _IN_EVENT.size <= len(data):
+            (wd, mask, cookie, size) = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            name = os.fsdecode(data[offset:offset + size].rstrip(b'\0'))
+            offset += size
+            if mask & _IN_Q_OVERFLOW:
+                self._log.warning("Lost inotify events.")
+                return None
+            
+            dirname = self._dirs.get(wd)
+            if dirname is None:
+                continue
+            path = os.path.join(dirname, name)
+            if name in self._files.get(dirname, ()):
+                changed.add(path)
+            if dirname not in self._trees:
+                continue
+            
+            if not (mask & _IN_ISDIR):
+                changed.add(path)
+            elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                if not _is_excluded(path, self._exclude):
+                    changed.update(self._watch_tree(path))
+                    changed.add(path)
+            elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                self._forget(path)
+                changed.add(path)
+        return changed
+    
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def createWatcher(roots, files, exclude=(), poll=False
+ , interval=_POLL_INTERVAL):
+    """Creates a watcher for the given files.
+    
+    Uses inotify if possible and falls back to polling.
+    
+    :param roots:    Directories that will be watched recursively.
+    :param files:    Additional files to watch.
+    :param exclude:  Directories (inside *roots*) to skip.
+    :param poll:     If set, polling will always be used.
+    :param interval: Seconds between two polls.
+    :returns:        InotifyWatcher or PollingWatcher instance.
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(roots, files, exclude=exclude)
+        except OSError as e:
+            logging.getLogger(_LOGGER_NAME).warning(
+                "Can't use inotify (%s), polling instead." % str(e))
+    return PollingWatcher(roots, files, exclude=exclude
+     , interval=interval)
+
+
+class BuildServer(object):
+    """Keeps the modules of a project loaded and builds on request.
+    
+    Changes are handled like this:
+    
+    - If the main config file changes, configure scripts are added
+      or removed, or the extension commands (``#$ use ...``) of a
+      script change, all modules will be loaded again.
+    - If a configure script changes, the script (and all scripts of
+      connected modules) will be executed again.
+    - If the config file changes, only scripts of modules whose
+      config has changed (and connected modules) will be executed
+      again.
+    - Changed targets and plain files will be found by the build
+      (see poutput.BuildManifest).
+    """
+    
+    RELOADED = 1
+    CHANGED = 2
+    # Flags returned by handleChanges (scripts have been executed
+    # again / the output has to be built again).
+    
+    def __init__(self, load, build, config_path, main_path, sock_path
+     , watcher, auto=False):
+        """Initializes the server and loads all modules.
+        
+        :param load:        Callable that creates a new ModuleManager
+                            (with all modules initialized).
+        :param build:       Callable that builds the output directory.
+                            It gets the ModuleManager and returns the
+                            number of files written.
+        :param config_path: Path to the current config file.
+        :param main_path:   Path to the main config of the project.
+        :param sock_path:   Path of the unix socket.
+        :param watcher:     The watcher (see `createWatcher`).
+        :param auto:        If set, the output will be built after each
+                            change (watch mode).
+        """
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self._load = load
+        self._build = build
+        self._config_path = os.path.abspath(config_path)
+        self._main_path = os.path.abspath(main_path)
+        self._sock_path = sock_path
+        self._watcher = watcher
+        self._auto = auto
+        self._running = False
+        self._builds = 0
+        self._man = None
+        self._config = dict()
+        self._reload()
+    
+    def _load_config(self):
+        if os.path.isfile(self._config_path):
+            try:
+                return pfile.loadConfigFile(self._config_path)
+            except ValueError as e:
+                self._log.error("Couldn't load config file (%s)." % str(e))
+        return dict()
+    
+    def _reload(self):
+        """Loads all modules again.
+        """
+        self._log.info("Loading all modules.")
+        self._config = self._load_config()
+        self._man = self._load()
+        self._man.loadNodes(config=self._config)
+    
+    def _scripts(self):
+        scripts = dict()
+        for name in self._man.getModuleNames():
+            path = self._man.getModule(name).scriptPath()
+            if path is not None:
+                scripts[os.path.abspath(path)] = name
+        return scripts
+    
+    def handleChanges(self, paths):
+        """Executes the scripts of all modules affected by *paths*.
+        
+        :param paths: Set of changed paths (None means that
+                      everything may have changed).
+        :returns:     Combination of RELOADED and CHANGED (each
+                      change of the source tree requires a build,
+                      even if no module has to be reloaded).
+        """
+        both = self.RELOADED | self.CHANGED
+        if paths is None or self._main_path in paths:
+            self._reload()
+            return both
+        
+        scripts = self._scripts()
+        changed = set()
+        for path in paths:
+            name = os.path.basename(path)
+            if path in scripts:
+                mod = self._man.getModule(scripts[path])
+                if not os.path.isfile(path) or mod.extensionsChanged():
+                    self._reload()
+                    return both
+                changed.add(scripts[path])
+            elif pmodules.isConfigScript(name) or os.path.isdir(path) \
+             or any(i.startswith(path + os.sep) for i in scripts):
+                # New modules (or directories that may contain some)
+                # or removed directories of modules.
+                self._reload()
+                return both
+        
+        # Everything except the config file belongs to the sources.
+        result = 0
+        if any(i != self._config_path for i in paths):
+            result = self.CHANGED
+        
+        config = None
+        if self._config_path in paths:
+            config = self._load_config()
+            for name in set(config) | set(self._config):
+                if config.get(name) != self._config.get(name):
+                    changed.add(name)
+            self._config = config
+        
+        if len(changed) == 0:
+            return result
+        reloaded = self._man.reloadModules(changed, config=config)
+        self._log.info("Reloaded module(s) %s."
+         % ", ".join(sorted(reloaded)))
+        return both
+    
+    def build(self):
+        """Builds the output directory (if fully configured).
+        
+        :returns: Tuple of a success flag and a message.
+        """
+        if not self._man.isFullyConfigured(warning=True):
+            return (False, "Not fully configured.")
+        touched = self._build(self._man)
+        self._builds += 1
+        return (True, "%d file(s) written." % touched)
+    
+    def _safe(self, func, *args):
+        """Calls *func*, errors will be logged but not raised.
+        """
+        try:
+            return func(*args)
+        except Exception as e:
+            self._log.exception("%s failed: %s" % (func.__name__, str(e)))
+            return (False, "%s: %s" % (e.__class__.__name__, str(e)))
+    
+    def _handle_request(self, conn):
+        """Handles a single request of a client.
+        """
+        with conn:
+            conn.settimeout(_POLL_INTERVAL * 10)
+            data = b''
+            while not data.endswith(b'\n') and len(data) < _MAX_REQUEST_SIZE:
+                block = conn.recv(4096)
+                if len(block) == 0:
+                    break
+                data += block
+            try:
+                cmd = json.loads(data.decode('utf-8')).get('cmd')
+            except ValueError:
+                cmd = None
+            
+            if cmd == CMD_BUILD:
+                (ok, msg) = self._safe(self.build)
+            elif cmd == CMD_STATUS:
+                (ok, msg) = (True, "%d module(s), %d build(s)."
+                 % (len(self._man.getModuleNames()), self._builds))
+            elif cmd == CMD_STOP:
+                self._running = False
+                (ok, msg) = (True, "Stopped.")
+            else:
+                (ok, msg) = (False, "Invalid request.")
+            conn.sendall(json.dumps({'ok' : ok, 'message' : msg}
+             ).encode('utf-8') + b'\n')
+    
+    def _listen(self):
+        if os.path.exists(self._sock_path):
+            try:
+                sendCommand(self._sock_path, CMD_STATUS)
+            except OSError:
+                # Stale socket of a daemon that hasn't been stopped.
+                os.remove(self._sock_path)
+            else:
+                raise DaemonError("Daemon is already running (%s)."
+                 % self._sock_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self._sock_path)
+        sock.listen(5)
+        return sock
+    
+    def serveForever(self):
+        """Serves requests and watches for changes until a client
+        sends the stop command (or the process is interrupted).
+        """
+        sock = self._listen()
+        sel = selectors.DefaultSelector()
+        sel.register(sock, selectors.EVENT_READ)
+        if self._watcher.fileno() is not None:
+            sel.register(self._watcher.fileno(), selectors.EVENT_READ)
+        if self._auto:
+            self._log.info(self._safe(self.build)[1])
+        
+        self._running = True
+        try:
+            while self._running:
+                events = sel.select(self._watcher.timeout())
+                if any(key.fileobj is sock for (key, mask) in events):
+                    (conn, addr) = sock.accept()
+                    self._safe(self._handle_request, conn)
+                if len(events) == 0 or any(key.fileobj is not sock
+                 for (key, mask) in events):
+                    time.sleep(_SETTLE_TIME)
+                    paths = self._watcher.changes()
+                    changes = self._safe(self.handleChanges, paths)
+                    if isinstance(changes, tuple):
+                        # Failed (has already been logged).
+                        changes = 0
+                    if self._auto and (changes & self.CHANGED):
+                        self._log.info(self._safe(self.build)[1])
+        finally:
+            sel.close()
+            sock.close()
+            self._watcher.close()
+            os.remove(self._sock_path)
+
+
+def sendCommand(sock_path, cmd):
+    """Sends a command to a running daemon.
+    
+    :param sock_path: Path of the unix socket.
+    :param cmd:       One of CMD_BUILD, CMD_STATUS and CMD_STOP.
+    :returns:         The response (dictionary with 'ok' and 'message').
+    :raises OSError:  If no daemon is listening on *sock_path*.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(sock_path)
+        sock.sendall(json.dumps({'cmd' : cmd}).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            block = sock.recv(4096)
+            if len(block) == 0:
+                break
+            data += block
+    return json.loads(data.decode('utf-8'))
@@ -11,14 +11,20 @@ helpful to find errors in source code using inline python code tags).
 """
 
 from functools import partial
+import io
 import sys
 import os
 import re
-import imp
+import ast
+import types
+import marshal
+import hashlib
+import importlib.util
 import traceback
 import logging
 import builtins
 from pbasic import NotYetWorkingWarning
+import pfile
 
 
 __author__ = 'Manuel Huber'
@@ -26,10 +32,23 @@ __copyright__ = "Copyright (c) 2011 Manuel Huber."
 __license__ = 'GPLv3'
 __docformat__ = "restructuredtext en"
 
+PARSER_VERSION = 2
+# Has to be increased each time the output of the parser changes.
+
 _START_TAG = "<?"
 _END_TAG = "?>"
-_CODE_RE = re.compile("^<\\?\\s*py:")
+_CODE_RE = re.compile("<\\?\\s*py:")
 _LOGGER_NAME = 'eval'
+_TEMPLATE_EXTENSION = '.pbt'
+_TEMPLATE_MAGIC = (b'PBT' + str(PARSER_VERSION).encode('ascii') + b'\n'
+ + importlib.util.MAGIC_NUMBER)
+_CODE_EXTENSION = '.pbc'
+_CODE_MAGIC = b'PBC\n' + importlib.util.MAGIC_NUMBER
+_CHUNK_SIZE = 1 << 16
+# Number of characters read at once by PyParser.parseStream.
+_MAX_STREAM_CODES = 256
+# Number of compiled code blocks PyParser.parseStream keeps to reuse
+# them for identical blocks.
 
 
 class EvalException(Exception):
@@ -63,6 +82,11 @@ class CodeEvalError(EvalException):
         self.line = line
         self.name = name
         self.cause = cause
+    
+    def __reduce__(self):
+        # Necessary to pass errors between processes.
+        return (self.__class__, (self.name, self.line, self.args
+         , self.cause))
 
 
 class NotAllowedError(EvalException):
@@ -83,6 +107,9 @@ class NotAllowedError(EvalException):
         text = "Tried to access builtin '%s'" % name
         EvalException.__init__(self, text, *args)
         self.name = name
+    
+    def __reduce__(self):
+        return (self.__class__, (self.name,) + self.args[1:])
 
 
 class MissingClosingTagError(EvalException):
@@ -104,6 +131,22 @@ class MissingClosingTagError(EvalException):
         EvalException.__init__(self, *args)
         self.line = line
         self.name = name
+    
+    def __reduce__(self):
+        return (self.__class__, (self.name, self.line) + self.args)
+
+
+def _move_code(code, delta):
+    """Moves all line numbers of a code object.
+    
+    :param code:  The code object.
+    :param delta: Number of lines to add.
+    :returns:     A copy of *code* (and all nested code objects).
+    """
+    consts = tuple(_move_code(i, delta) if isinstance(i, types.CodeType)
+     else i for i in code.co_consts)
+    return code.replace(co_firstlineno=(code.co_firstlineno + delta)
+     , co_consts=consts)
 
 
 def _cpp_escape(value):
@@ -121,23 +164,27 @@ class EchoHelper(object):
     that will be offered to the inline code.
     """
     
-    def __init__(self, dst):
+    def __init__(self, dst, buffered=False):
         """Initializes a new instance.
         
-        :param dst: A file like object that represents the file
-                    to write to.
+        :param dst:        A file like object that represents the
+                           file to write to.
+        :keyword buffered: If set, *dst* won't be flushed after each
+                           call. The owner has to flush *dst* when
+                           all output has been written.
         """
         self._dst = dst
+        self._buffered = buffered
     
     def _list_echo(self, text, pre=None, post=None):
+        chunks = [str(element) for element in text]
         if not (pre is None):
-            self._dst.write(str(pre))
-        if len(text) > 0:
-            for element in text:
-                self._dst.write(str(element))
+            chunks.insert(0, str(pre))
         if not (post is None):
-            self._dst.write(str(post))
-        self._dst.flush()
+            chunks.append(str(post))
+        self._dst.write("".join(chunks))
+        if not self._buffered:
+            self._dst.flush()
     
     def echo(self, *text):
         self._list_echo(text)
@@ -284,7 +331,7 @@ class ExecEnvironment(object):
         if ovr_builtins:
             # Not yet finished!!!
             # This is not yet safe
-            bi = imp.new_module("exbuiltins")
+            bi = types.ModuleType("exbuiltins")
             setattr(bi, 'getattr', self._get_attr)
         elif bi is None:
             bi = builtins
@@ -298,24 +345,37 @@ class ExecEnvironment(object):
         else:
             return builtins.getattr(attr_name)
     
-    def __call__(self, data, add_ln=0):
-        """Executes the given string as python code.
+    def compile(self, data, add_ln=0):
+        """Compiles the given string to a code object.
         
-        :param data:     Data that will be executed.
-        :keyword add_ln: This number will be added to the line
-                          number, if an error occurres.
+        The line numbers of the code object will already contain
+        the offset *add_ln*, so the code object can be executed
+        later (see `execute`) and errors still point to the right
+        line.
+        
+        :param data:     Data that will be compiled.
+        :keyword add_ln: This number will be added to all line
+                         numbers.
+        :returns:        The compiled code object.
         """
         try:
-            code = compile(data, self.name, 'exec')
+            tree = ast.parse(data, self.name, 'exec')
+            if add_ln > 0:
+                ast.increment_lineno(tree, add_ln)
+            return compile(tree, self.name, 'exec')
         except (KeyboardInterrupt, SystemExit):
             raise
         except SyntaxError as e:
-            tb = sys.exc_info()[2]
-            ln = tb.tb_lineno + add_ln
+            ln = (e.lineno or 1) + add_ln
             self._log.debug("Error while trying to compile user-code.")
             raise CodeEvalError(self.name, ln, e.args
              , cause=e.text) from e
+    
+    def execute(self, code):
+        """Executes a code object created by `compile`.
         
+        :param code: The code object that will be executed.
+        """
         try:
             exec(code, self.env, self.env)
         except (KeyboardInterrupt, SystemExit):
@@ -325,10 +385,248 @@ class ExecEnvironment(object):
             if tb.tb_next is None:
                 raise
             tb = tb.tb_next
-            ln = tb.tb_lineno + add_ln
+            ln = tb.tb_lineno
             self._log.debug("Error while trying to execute user-code.")
             raise CodeEvalError(self.name, ln, e.args
              , cause=str(e)) from e
+    
+    def __call__(self, data, add_ln=0):
+        """Executes the given string as python code.
+        
+        :param data:     Data that will be executed.
+        :keyword add_ln: This number will be added to the line
+                          number, if an error occurres.
+        """
+        self.execute(self.compile(data, add_ln=add_ln))
+
+
+def _write_cache_file(path, data):
+    """Atomically writes a file of a cache directory.
+    
+    The data will be written to a temporary file first, so other
+    processes never see half-written cache files.
+    
+    :param path: Path of the cache file (the directory will be
+                 created if necessary).
+    :param data: The content (bytes).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pfile.writeFile(path, data, sync=False)
+
+
+class Template(object):
+    """This class represents a compiled file.
+    
+    A template consists of literal chunks (strings) and code
+    objects of the inline python code blocks (in the order they
+    appear in the file). Since the code objects already contain
+    the correct line numbers, a template can be rendered any
+    number of times (with different environments) without
+    parsing or compiling the file again.
+    """
+    
+    def __init__(self, parts):
+        """Initializes a new instance.
+        
+        :param parts: A sequence of strings and code objects.
+        """
+        self.parts = tuple(parts)
+    
+    def dumps(self):
+        """Serializes this template.
+        
+        :returns: A bytes object (see `loads`).
+        """
+        return _TEMPLATE_MAGIC + marshal.dumps(self.parts)
+    
+    @classmethod
+    def loads(cls, data):
+        """Creates a template from serialized data.
+        
+        :param data: Data created by `dumps`.
+        :returns:    The template or None if *data* has been created
+                     by some other parser or interpreter version.
+        """
+        if not data.startswith(_TEMPLATE_MAGIC):
+            return None
+        try:
+            parts = marshal.loads(data[len(_TEMPLATE_MAGIC):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        return cls(parts)
+
+
+class TemplateCache(object):
+    """This class caches compiled templates.
+    
+    Templates will be stored in a directory (one file per template)
+    and will be identified by the hash (sha1) of the content of the
+    source file. So changing the configuration doesn't invalidate any
+    template.
+    """
+    
+    def __init__(self, path):
+        """Initializes a new instance.
+        
+        :param path: Directory where compiled templates will be
+                     stored (will be created if necessary) or None
+                     to keep them in memory only.
+        """
+        self._path = path
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self._templates = dict()
+    
+    def directory(self):
+        """Returns the directory of this cache.
+        
+        :returns: Path to the cache directory.
+        """
+        return self._path
+    
+    def _cache_file(self, digest):
+        return os.path.join(self._path, digest + _TEMPLATE_EXTENSION)
+    
+    def _load(self, digest):
+        if self._path is None:
+            return None
+        path = self._cache_file(digest)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                return Template.loads(f.read())
+    
+    def _store(self, digest, template):
+        if self._path is None:
+            return
+        _write_cache_file(self._cache_file(digest), template.dumps())
+    
+    def _compile(self, path, name):
+        """Compiles the file *path*.
+        
+        :returns: Tuple of the digest of the data that has really
+                  been compiled and the Template instance.
+        """
+        self._log.debug("Compiling template '%s'." % path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        # Decoded like open(path, 'r') would do.
+        data = io.TextIOWrapper(io.BytesIO(raw)).read()
+        template = PyParser(None, dict(), name=name).compileString(data)
+        return (hashlib.sha1(raw).hexdigest(), template)
+    
+    def get(self, path, name=None, digest=None):
+        """Returns the compiled template of the file *path*.
+        
+        If the file has changed since *digest* has been calculated,
+        the template of the current content will be returned (and
+        cached under the digest of the current content).
+        
+        :param path:     Path to the file.
+        :keyword name:   Name used to compile the file (default
+                         is *path*).
+        :keyword digest: Hex digest of the sha1 hash of the content
+                         of the file if it is already known (then the
+                         file will only be read if it isn't cached).
+        :returns:        The Template instance.
+        """
+        if name is None:
+            name = path
+        if digest is None:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+        
+        template = self._templates.get(digest)
+        if template is None:
+            template = self._load(digest)
+            if template is None:
+                (actual, template) = self._compile(path, name)
+                if actual != digest:
+                    self._log.debug("Template '%s' has changed since it "
+                     "has been hashed." % path)
+                    digest = actual
+                self._store(digest, template)
+            self._templates[digest] = template
+        return template
+
+
+class CodeCache(object):
+    """This class caches compiled scripts (f.e. configure scripts).
+    
+    Scripts will be identified by their path. A cached code object
+    is valid as long as size and mtime of the script and the magic
+    number of the interpreter don't change (just like python's own
+    *.pyc* files).
+    """
+    
+    def __init__(self, path):
+        """Initializes a new instance.
+        
+        :param path: Directory where compiled scripts will be
+                     stored (will be created if necessary) or None
+                     to keep them in memory only.
+        """
+        self._path = path
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self._codes = dict()
+    
+    def directory(self):
+        """Returns the directory of this cache.
+        
+        :returns: Path to the cache directory.
+        """
+        return self._path
+    
+    def _cache_file(self, path):
+        if self._path is None:
+            return None
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8'
+         , 'surrogateescape')).hexdigest()
+        return os.path.join(self._path, digest + _CODE_EXTENSION)
+    
+    def _header(self, path):
+        st = os.stat(path)
+        return _CODE_MAGIC + ("%d %d %s\n" % (st.st_size, st.st_mtime_ns
+         , os.path.abspath(path))).encode('utf-8', 'surrogateescape')
+    
+    def _load(self, cache_path, header):
+        if (cache_path is None) or (not os.path.isfile(cache_path)):
+            return None
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(header):
+            return None
+        try:
+            return marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            self._log.warning("Ignoring invalid cache file '%s'."
+             % cache_path)
+            return None
+    
+    def get(self, path, env):
+        """Returns the code object of the script *path*.
+        
+        If there is no valid code object in the cache, the script
+        will be compiled and stored.
+        
+        :param path: Path to the script.
+        :param env:  The ExecEnvironment used to compile the script.
+        :returns:    The compiled code object.
+        """
+        header = self._header(path)
+        (old_header, code) = self._codes.get(path, (None, None))
+        if old_header == header:
+            return code
+        
+        cache_path = self._cache_file(path)
+        code = self._load(cache_path, header)
+        if code is None:
+            self._log.debug("Compiling script '%s'." % path)
+            with open(path, 'r') as f:
+                code = env.compile(f.read())
+            if cache_path is not None:
+                _write_cache_file(cache_path, header
+                 + marshal.dumps(code))
+        self._codes[path] = (header, code)
+        return code
 
 
 class PyParser(object):
@@ -338,40 +636,145 @@ class PyParser(object):
     to a stream.
     """
     
-    def __init__(self, dst, env, name="<noname>"):
+    def __init__(self, dst, env, name="<noname>", buffered=False):
         """Initializes a new instance.
         
-        :param dst:    The destination stream. All data will be written
-                       to this stream.
-        :param env:    The environment which will be used to execute
-                       the inline python code.
-        :keyword name: Name to idientify the file that is about to
-                       be executed.
+        :param dst:        The destination stream. All data will be
+                           written to this stream.
+        :param env:        The environment which will be used to
+                           execute the inline python code.
+        :keyword name:     Name to idientify the file that is about to
+                           be executed.
+        :keyword buffered: If set, the destination stream will only be
+                           flushed once (after the whole file has been
+                           written) instead of after each *echo* call.
         """
         self._dst = dst
         self._name = name
+        self._buffered = buffered
         self._log = logging.getLogger(_LOGGER_NAME)
         self._curr_line = 1
         self._eval = ExecEnvironment(env, name=name)
     
-    def _eval_data(self, code):
-        """Evaluates an inline python code block.
+    def _tokenize(self, data):
+        """Splits *data* into literal chunks and inline code.
         
-        :param code: The source code that this method will
-                     execute.
+        :param data: Data that will be split.
+        :returns:    Yields tuples (is_code, chunk, line) (see
+                     `_tokenize_chunks`).
         """
-        self._eval(code, add_ln=(self._curr_line - 1))
+        return self._tokenize_chunks(iter((data,)))
     
-    def _add_line_count(self, chunk):
-        """Counts newline characters and adds them to current.
+    def _tokenize_chunks(self, chunks):
+        """Splits data that is read in chunks into literal chunks
+        and inline code.
         
-        This method just counts all newline characters in *chunk*
-        and adds the number to the current line number 
-        *self._curr_line*.
+        The data will be scanned once from the start to the end
+        (without copying the remaining data for each tag). Only
+        the data after the last complete tag will be kept, so tags
+        can span any number of chunks. Long literal text may be
+        split into several literal chunks. Unknown tags (f.e.
+        '<?xml ... ?>') will be treated as literal chunks.
         
-        :param chunk: The string to search for newline characters.
+        :param chunks: Iterator of strings (the data).
+        :returns:      Yields tuples (is_code, chunk, line), where
+                       line is the line number the chunk starts at.
         """
-        self._curr_line += chunk.count('\n')
+        self._curr_line = 1
+        data = next(chunks, '')
+        ahead = next(chunks, '')
+        pos = 0
+        
+        while True:
+            start_pos = data.find(_START_TAG, pos)
+            end_pos = -1
+            if start_pos >= 0:
+                end_pos = data.find(_END_TAG, start_pos + len(_START_TAG))
+            if end_pos < 0 and len(ahead) > 0:
+                # The next tag may continue in the next chunk, so only
+                # text before it (or before a partial start tag) is
+                # complete.
+                keep = start_pos
+                if start_pos < 0:
+                    keep = max(pos, len(data) - len(_START_TAG) + 1)
+                if keep > pos:
+                    yield (False, data[pos:keep], self._curr_line)
+                    self._curr_line += data.count('\n', pos, keep)
+                data = data[keep:] + ahead
+                ahead = next(chunks, '')
+                pos = 0
+                continue
+            if start_pos < 0:
+                break
+            if start_pos > pos:
+                yield (False, data[pos:start_pos], self._curr_line)
+                self._curr_line += data.count('\n', pos, start_pos)
+            
+            code_match = _CODE_RE.match(data, start_pos)
+            if code_match is None:
+                code_pos = start_pos + len(_START_TAG)
+            else:
+                code_pos = code_match.end()
+            end_pos = data.find(_END_TAG, code_pos)
+            if end_pos < 0:
+                self._log.error("No closing ?>, line '%d':"
+                 % self._curr_line)
+                raise MissingClosingTagError(self._eval.name
+                 , self._curr_line)
+            
+            if code_match is None:
+                self._log.warning("Unknown tag (~line '%d')."
+                 % self._curr_line)
+                pos = end_pos + len(_END_TAG)
+                yield (False, data[start_pos:pos], self._curr_line)
+            else:
+                yield (True, data[code_pos:end_pos], self._curr_line)
+                pos = end_pos + len(_END_TAG)
+            self._curr_line += data.count('\n', start_pos, pos)
+        
+        if pos < len(data):
+            yield (False, data[pos:], self._curr_line)
+    
+    def compileString(self, data):
+        """Compiles a string to a template.
+        
+        All inline code blocks will be compiled, but nothing will
+        be executed.
+        
+        :param data: Data that will be compiled.
+        :type data:  string
+        :returns:    A Template instance (see `parseTemplate`).
+        """
+        parts = list()
+        for (is_code, chunk, line) in self._tokenize(data):
+            if is_code:
+                parts.append(self._eval.compile(chunk, add_ln=(line - 1)))
+            else:
+                parts.append(chunk)
+        return Template(parts)
+    
+    def _add_echo(self):
+        echo_obj = EchoHelper(self._dst, buffered=self._buffered)
+        self._eval.env['echo'] = echo_obj.echo
+        self._eval.env['put'] = echo_obj.echo_nl
+        self._eval.env['sput'] = echo_obj.str_echo_nl
+        self._eval.env['secho'] = echo_obj.str_echo
+    
+    def parseTemplate(self, template):
+        """Executes a compiled template.
+        
+        All literal chunks will be copied to self._dst (see
+        constructor), all code objects will be executed.
+        
+        :param template: A Template instance (see `compileString`).
+        """
+        self._add_echo()
+        for part in template.parts:
+            if isinstance(part, str):
+                self._dst.write(part)
+            else:
+                self._eval.execute(part)
+        self._dst.flush()
     
     def parseString(self, data):
         """Parses a string and executes all inline code.
@@ -383,54 +786,35 @@ class PyParser(object):
         :param data: Data that will be parsed and executed.
         :type data: string
         """
-        echo_obj = EchoHelper(self._dst)
-        self._eval.env['echo'] = echo_obj.echo
-        self._eval.env['put'] = echo_obj.echo_nl
-        self._eval.env['sput'] = echo_obj.str_echo_nl
-        self._eval.env['secho'] = echo_obj.str_echo
+        self.parseTemplate(self.compileString(data))
+    
+    def parseStream(self, src, chunk_size=_CHUNK_SIZE):
+        """Parses a stream and executes all inline code.
         
-        tag = False
-        code = ''
-        found = True
-        self._curr_line = 1
+        Works like `parseString`, but *src* will be read in chunks
+        and each part will be written (or executed) as soon as it
+        is complete. So only one chunk (and the code block that is
+        parsed at the moment) has to fit into memory. Identical code
+        blocks (f.e. in each row of a generated table) will only be
+        compiled once.
         
-        while found:
-            if not tag:
-                start_pos = data.find(_START_TAG)
-                if start_pos >= 0:
-                    chunk = data[0:start_pos]
-                    if len(chunk) > 0:
-                        self._add_line_count(chunk)
-                        self._dst.write(chunk)
-                    tag = True
-                    data = data[start_pos:]
-                    code_match = _CODE_RE.search(data)
-                    if not (code_match is None):
-                        code = ''
-                        data = data[code_match.end():]
-                else:
-                    found = False
-            
-            if tag:
-                end_pos = data.find(_END_TAG)
-                if end_pos >= 0:
-                    tag = False
-                    if not (code_match is None):
-                        code = data[0:end_pos]
-                        self._eval_data(code)
-                        self._add_line_count(code)
-                        end_pos += len(_END_TAG)
-                        data = data[end_pos:]
-                    else:
-                        self._log.warning("Unknown tag (~line '%d')."
-                         % self._curr_line)
+        :param src:          A (text) file like object to read from.
+        :keyword chunk_size: Number of characters to read at once.
+        """
+        self._add_echo()
+        codes = dict()
+        chunks = iter(partial(src.read, chunk_size), '')
+        for (is_code, chunk, line) in self._tokenize_chunks(chunks):
+            if is_code:
+                if chunk in codes:
+                    (code, code_line) = codes[chunk]
+                    code = _move_code(code, line - code_line)
                 else:
-                    found = False
-                    self._log.error("No closing ?>, line '%d':"
-                     % self._curr_line)
-                    raise MissingClosingTagError(self._eval.name
-                     , self._curr_line)
-        
-        if len(data) > 0:
-            self._dst.write(data)
-            self._dst.flush()
+                    if len(codes) >= _MAX_STREAM_CODES:
+                        codes.clear()
+                    code = self._eval.compile(chunk, add_ln=(line - 1))
+                    codes[chunk] = (code, line)
+                self._eval.execute(code)
+            else:
+                self._dst.write(chunk)
+        self._dst.flush()
@@ -7,9 +7,30 @@ This module covers loading and saving external files:
 
 - loading configuartion files
 - loading main config file
+
+Files are written atomically (temporary file, fsync and rename), so
+an interrupted write never leaves a truncated file behind.
+`FileLock` serializes processes that work on the same project.
+
+JSON is the interchange format of all files. Large configurations
+can also be stored as binary snapshot (marshal, with a header that
+contains the snapshot version). Both formats will be detected when a
+file is loaded. Snapshots only contain what JSON can represent, so
+a file is loaded with the same types regardless of its format.
 """
 
+import os
+import gc
 import json
+import shutil
+import locale
+import filecmp
+import marshal
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 __author__ = 'Manuel Huber'
@@ -17,17 +38,306 @@ __copyright__ = "Copyright (c) 2011 Manuel Huber."
 __license__ = 'GPLv3'
 __docformat__ = "restructuredtext en"
 
+FORMAT_JSON = 'json'
+FORMAT_SNAPSHOT = 'snapshot'
+FORMATS = (FORMAT_JSON, FORMAT_SNAPSHOT)
+
+SNAPSHOT_VERSION = 1
+# Will be increased if the layout of snapshots changes.
+
+_SNAPSHOT_MAGIC = b'PBSNAP'
+ENCODING = locale.getpreferredencoding(False)
+# Encoding of JSON files and rendered output (the same 'open' uses by
+# default).
+_TMP_FILE = '.%s.%d.tmp'
+_JSON_SCALARS = frozenset((str, int, float, bool, type(None)))
+_BACKUP_FILE = '%s.%d.bak'
+
+
+def loads(data):
+    """Loads objects from the content of a file.
+    
+    The garbage collector will be paused meanwhile (large configs
+    consist of lots of containers that would trigger it over and
+    over again).
+    
+    :param data: Content of a JSON file or a snapshot (bytes).
+    :returns:    The loaded objects.
+    :raises ValueError: If the data is invalid or the snapshot has
+                        been written by an unsupported version.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _loads(data):
+    """Detects the format of *data* and loads it (see `loads`).
+    """
+    if not data.startswith(_SNAPSHOT_MAGIC):
+        return json.loads(data.decode(ENCODING))
+    
+    header_size = len(_SNAPSHOT_MAGIC) + 3
+    header = data[len(_SNAPSHOT_MAGIC):header_size]
+    if (header[:1] != bytes([SNAPSHOT_VERSION])) or (len(header) != 3) \
+     or (header[1] > marshal.version) or (header[2:] != b'\n'):
+        raise ValueError("Unsupported snapshot version (expected %d)"
+         % SNAPSHOT_VERSION)
+    try:
+        return marshal.loads(data[header_size:])
+    except (EOFError, TypeError) as e:
+        raise ValueError("Invalid snapshot (%s)" % str(e)) from e
+
+
+def _is_plain_json(objs):
+    """Checks if *objs* only consists of types JSON keeps as they are
+    (dictionaries with string keys, lists and scalars).
+    """
+    if type(objs) in _JSON_SCALARS:
+        return True
+    stack = [objs]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if type(obj) is dict:
+            if not all(type(key) is str for key in obj):
+                return False
+            items = obj.values()
+        elif type(obj) is list:
+            items = obj
+        else:
+            return False
+        for i in items:
+            if type(i) not in _JSON_SCALARS:
+                stack.append(i)
+    return True
+
+
+def dumps(objs, fmt=FORMAT_JSON):
+    """Serializes objects.
+    
+    Snapshots will contain exactly what a JSON file would contain:
+    tuples become lists and keys become strings, and objects JSON
+    can't represent (f.e. sets) raise a TypeError in both formats.
+    
+    :param objs: Objects to save (f.e. a dictionary).
+    :param fmt:  One of FORMATS.
+    :returns:    The content of the file (bytes).
+    :raises TypeError: If *objs* can't be represented by JSON.
+    """
+    if fmt == FORMAT_SNAPSHOT:
+        if not _is_plain_json(objs):
+            objs = json.loads(json.dumps(objs))
+        return (_SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION, marshal.version])
+         + b'\n' + marshal.dumps(objs))
+    return json.dumps(objs).encode(ENCODING)
+
+
+def fileFormat(path):
+    """Detects the format of a file.
+    
+    :param path: Path to the file.
+    :returns:    FORMAT_SNAPSHOT or FORMAT_JSON (also if the file
+                 doesn't exist).
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(_SNAPSHOT_MAGIC)) == _SNAPSHOT_MAGIC:
+                return FORMAT_SNAPSHOT
+    except FileNotFoundError:
+        pass
+    return FORMAT_JSON
+
 
 def loadConfigFile(path):
+    """Loads a config (or control) file.
+    
+    :param path: Path to a JSON file or a snapshot.
+    :returns:    The loaded objects.
+    """
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def _sync_dir(dirname):
+    """Flushes a directory (so a rename will survive a crash).
+    
+    Not every platform can open directories, errors are ignored.
+    """
+    try:
+        fd = os.open(dirname or os.curdir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _rotate_backups(path, backups):
+    """Moves the existing backups of *path* one step further and
+    keeps the current content of *path* as first backup.
+    
+    The first backup is a hard link (or a copy), so *path* exists
+    all the time.
+    
+    :param path:    Path to the file.
+    :param backups: Number of backups to keep.
+    """
+    for i in range(backups - 1, 0, -1):
+        if os.path.lexists(_BACKUP_FILE % (path, i)):
+            os.replace(_BACKUP_FILE % (path, i)
+             , _BACKUP_FILE % (path, i + 1))
+    (dirname, name) = os.path.split(path)
+    tmp_path = os.path.join(dirname, _TMP_FILE % (name + '.bak'
+     , os.getpid()))
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, _BACKUP_FILE % (path, 1))
+
+
+def writeFile(path, data, backups=0, sync=True, mode_from=None
+ , compare=False, follow_links=True):
+    """Atomically replaces the content of a file.
+    
+    The data will be written to a temporary file in the same
+    directory and renamed to *path*. If anything fails (or the
+    process gets interrupted), the old file is left untouched.
+    The permission bits of an existing file will be kept.
     
-    with open(path, "r") as f:
-        return json.load(f)
+    :param path:         Path to the file.
+    :param data:         The new content (bytes) or a callable that
+                         writes it to the (binary) file object it gets.
+    :param backups:      Number of backups (*path*.1.bak is the newest
+                         one) to keep of the old content.
+    :param sync:         If set, the file (and the directory) will be
+                         flushed to disk, so the new content survives
+                         a crash.
+    :param mode_from:    Optional path of a file whose permission bits
+                         will be copied instead.
+    :param compare:      If set, the existing file will be kept if it
+                         has the same content as the new one.
+    :param follow_links: If set, symbolic links will be resolved (the
+                         file they point to will be replaced), else
+                         the link itself will be replaced.
+    :returns:            True if the file has been replaced.
+    """
+    if follow_links:
+        path = os.path.realpath(path)
+    (dirname, name) = os.path.split(path)
+    tmp_path = os.path.join(dirname, _TMP_FILE % (name, os.getpid()))
+    if mode_from is None and os.path.isfile(path):
+        mode_from = path
+    try:
+        with open(tmp_path, "wb") as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        if compare and os.path.isfile(path) \
+         and filecmp.cmp(tmp_path, path, shallow=False):
+            os.remove(tmp_path)
+            return False
+        if mode_from is not None:
+            shutil.copymode(mode_from, tmp_path)
+        if backups > 0 and os.path.isfile(path):
+            _rotate_backups(path, backups)
+        os.replace(tmp_path, path)
+    except:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if sync:
+        _sync_dir(dirname)
+    return True
 
 
-def saveConfigFile(path, objs):
+def saveConfigFile(path, objs, fmt=None, backups=0):
+    """Saves a config (or control) file (see `writeFile`).
     
-    with open(path, "w") as f:
-        json.dump(objs, f)
+    :param path:    Path to the file.
+    :param objs:    Objects to save.
+    :param fmt:     One of FORMATS. If not set, the format of the
+                    existing file will be kept (JSON for new files).
+    :param backups: Number of backups to keep.
+    """
+    if fmt is None:
+        fmt = fileFormat(path)
+    writeFile(path, dumps(objs, fmt), backups=backups)
 
 loadControlFile = loadConfigFile
 saveControlFile = saveConfigFile
+
+
+class FileLock(object):
+    """Advisory lock (flock) of a lock file.
+    
+    Used as context manager. The lock file will be created if it
+    doesn't exist. On platforms without fcntl nothing is locked.
+    A shared lock isn't acquired either if the lock file can't be
+    opened (f.e. in a read-only checkout).
+    """
+    
+    def __init__(self, path, shared=False, waiting=None):
+        """Initializes the lock (it will be acquired by *with*).
+        
+        :param path:    Path of the lock file.
+        :param shared:  If set, a shared lock will be acquired
+                        (other shared locks are allowed).
+        :param waiting: Optional callable that is called (with
+                        *path*) before blocking on a held lock.
+        """
+        self.path = path
+        self._shared = shared
+        self._waiting = waiting
+        self._file = None
+    
+    def acquire(self):
+        """Blocks until the lock has been acquired.
+        """
+        if fcntl is None or self._file is not None:
+            return
+        try:
+            self._file = open(self.path, "ab")
+        except OSError:
+            if not self._shared:
+                raise
+            try:
+                self._file = open(self.path, "rb")
+            except OSError:
+                return
+        op = fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX
+        try:
+            try:
+                fcntl.flock(self._file.fileno(), op | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if self._waiting is not None:
+                    self._waiting(self.path)
+                fcntl.flock(self._file.fileno(), op)
+        except:
+            self.release()
+            raise
+    
+    def release(self):
+        """Releases the lock (closing the file releases it).
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
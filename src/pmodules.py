@@ -10,18 +10,22 @@ from warnings import warn
 from optparse import OptionParser
 from ast import literal_eval
 import os
+import io
 import re
 import sys
 import json
 import shlex
-import shutil
+import fnmatch
 import math
 import logging
 import collections
 from pbasic import NotYetWorkingWarning
-from peval import PyParser, ExecEnvironment
+from peval import PyParser, ExecEnvironment, TemplateCache
+from peval import CodeEvalError, MissingClosingTagError
 import targets
 import puser
+import pfile
+import poutput
 
 
 
@@ -62,6 +66,21 @@ _WARN_EXC_EXT_FAILED = "Couldn't exec extension '%s' (args: '%s')."
 _WARN_EXT_NOT_YET_WORKING = "The extension '%s' is not yet implemented."
 _CRITICAL_MODULE_NOT_INITIALIZED = ("Module '%s' hasn't been "
     + "initialized. Can't return path.")
+_ERR_RENDER_FAILED = "Couldn't render '%s' (line %s): %s"
+_WARN_FRAME_CYCLE = "Cyclic dependency between frames: %s."
+_ERR_FRAMES_NOT_SETTLED = ("Frames still have to be executed after %d "
+    + "rounds: %s.")
+_WARN_TARGETS_IGNORED = ("Targets in '%s' will be ignored (directory "
+    + "matches an ignore pattern).")
+
+_MAX_FRAME_ROUNDS = 100
+# Upper bound of rounds FrameScheduler.run uses to reach a fixpoint.
+_STREAM_SIZE = 1 << 24
+# Targets larger than this (in bytes) will be rendered without
+# loading them into memory (see renderTarget).
+
+DISCOVERY_VERSION = 1
+# Will be increased if the layout of the discovery index changes.
 
 
 class ModuleException(Exception):
@@ -92,6 +111,14 @@ class ChoiceNodeAlreadyBoundError(ModuleException):
     pass
 
 
+class FramesNotSettledError(ModuleException):
+    
+    def __init__(self, frames, cycles=None):
+        ModuleException.__init__(self)
+        self.frames = frames
+        self.cycles = list() if cycles is None else cycles
+
+
 class ExtensionWarning(UserWarning):
     pass
 
@@ -100,6 +127,10 @@ class ViewListIgnoredWarning(UserWarning):
     pass
 
 
+class IgnoredTargetsWarning(UserWarning):
+    pass
+
+
 def _unique_name(name):
     """Creates a unique module (or node) name.
     
@@ -109,6 +140,245 @@ def _unique_name(name):
     return name.strip().upper()
 
 
+def isConfigScript(filename):
+    """Checks if *filename* is the name of a configure script.
+    
+    :param filename: Name of the file (without directory).
+    :returns:        True if it is a configure_XXX.py script.
+    """
+    return _CFG_SCRIPTFILE_RE.match(filename) is not None
+
+
+def renderTarget(src_path, dst_path, cfg_dict, tcache=None, digest=None):
+    """Renders a single target.
+    
+    The target will be rendered from the source file into memory and
+    the output file will only be replaced if the result differs from
+    it. Large targets (see _STREAM_SIZE) will be streamed to a
+    temporary file instead (and won't be cached). Each target gets
+    its own environment, so targets can't influence each other (no
+    matter in which order or process they will be rendered).
+    
+    :param src_path: Path to the target in the source directory.
+    :param dst_path: Path to the target in the output directory.
+    :param cfg_dict: Formatted config dictionary of the module.
+    :param tcache:   Optional peval.TemplateCache.
+    :param digest:   Optional hash of the source (see poutput.fileHash)
+                     that will be used to look up the template.
+    :returns:        True if the output file has been written.
+    """
+    env = {'__builtins__' : __builtins__, 'math' : math}
+    env.update(cfg_dict)
+    
+    if os.path.getsize(src_path) > _STREAM_SIZE:
+        def render(dst):
+            with open(src_path, 'r') as f:
+                PyParser(dst, env, name=src_path
+                 , buffered=True).parseStream(f)
+        
+        return poutput.replaceFileStream(dst_path, render
+         , mode_from=src_path)
+    
+    out = io.StringIO()
+    parser = PyParser(out, env, name=src_path, buffered=True)
+    if tcache is None:
+        with open(src_path, 'r') as f:
+            parser.parseString(f.read())
+    else:
+        parser.parseTemplate(tcache.get(src_path, digest=digest))
+    return poutput.replaceFile(dst_path, out.getvalue()
+     , mode_from=src_path)
+
+
+_worker_tcache = None
+# Template cache of a worker process (see _render_job).
+
+
+def _render_job(job):
+    """Renders a target in a worker process.
+    
+    :param job: Tuple of source path, target path, config dictionary,
+                the directory of the template cache (or None) and
+                the hash of the source (or None).
+    :returns:   See renderTarget.
+    """
+    global _worker_tcache
+    (src_path, dst_path, cfg_dict, cache_dir, digest) = job
+    tcache = None
+    if cache_dir is not None:
+        if ((_worker_tcache is None)
+         or (_worker_tcache.directory() != cache_dir)):
+            _worker_tcache = TemplateCache(cache_dir)
+        tcache = _worker_tcache
+    return renderTarget(src_path, dst_path, cfg_dict, tcache=tcache
+     , digest=digest)
+
+
+class ChangePropagator(object):
+    """Propagates changed nodes to their info seekers.
+    
+    Changed nodes will be marked dirty. Outside of a transaction, the
+    dirty set will be processed immediately. Inside a transaction
+    (see `transaction`), it will be processed once when the outermost
+    transaction ends. All info seekers that are (transitively)
+    affected will then be updated exactly once and in dependency
+    order (a node is updated before all of its seekers).
+    
+    Listeners (see `addListener`) will be told which nodes have been
+    touched and which modules got new or lost nodes, after all
+    seekers have been updated.
+    """
+    
+    def __init__(self):
+        """Initializes a new instance."""
+        self._depth = 0
+        self._dirty = dict()
+        # Used as ordered set (values are ignored).
+        self._touched = set()
+        self._layouts = set()
+        self._listeners = list()
+    
+    def __enter__(self):
+        self._depth += 1
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+        return False
+    
+    def changed(self, node):
+        """Marks *node* as changed.
+        
+        :param node: The node whose value (or status) has changed.
+        """
+        self._dirty[node] = None
+        if self._depth == 0:
+            self.flush()
+    
+    def layoutChanged(self, module):
+        """Marks that nodes have been added to (or removed from)
+        *module*.
+        
+        :param module: The ModuleNode.
+        """
+        if len(self._listeners) > 0:
+            self._layouts.add(module)
+            if self._depth == 0:
+                self.flush()
+    
+    def addListener(self, listener):
+        """Adds a listener that will be called after changes have
+        been propagated.
+        
+        :param listener: Callable that gets the set of all nodes
+                         that have changed or whose seekers have been
+                         updated (so their value, status or disabled
+                         state may have changed) and the set of all
+                         modules whose nodes have changed (see
+                         `layoutChanged`).
+        """
+        self._listeners.append(listener)
+    
+    def removeListener(self, listener):
+        """Removes a listener (see `addListener`).
+        """
+        self._listeners.remove(listener)
+    
+    def _order(self, sources):
+        """Sorts all seekers reachable from *sources*.
+        
+        :param sources: The changed nodes.
+        :returns:       List of all (transitive) seekers, every
+                        seeker after all seekers it depends on.
+                        Seekers that are part of a cycle will be
+                        appended.
+        """
+        reachable = dict()
+        stack = list(sources)
+        while len(stack) > 0:
+            for seeker in stack.pop()._iseeker:
+                if seeker not in reachable:
+                    reachable[seeker] = 0
+                    if isinstance(seeker, BasicNode):
+                        stack.append(seeker)
+        
+        for seeker in reachable:
+            if isinstance(seeker, BasicNode):
+                for i in seeker._iseeker:
+                    reachable[i] += 1
+        
+        ordered = [i for (i, pending) in reachable.items()
+         if pending == 0]
+        for seeker in ordered:
+            if isinstance(seeker, BasicNode):
+                for i in seeker._iseeker:
+                    reachable[i] -= 1
+                    if reachable[i] == 0:
+                        ordered.append(i)
+        if len(ordered) < len(reachable):
+            done = set(ordered)
+            ordered.extend(i for i in reachable if i not in done)
+        return ordered
+    
+    def flush(self):
+        """Updates all seekers of the dirty nodes."""
+        self._depth += 1
+        try:
+            while len(self._dirty) > 0:
+                sources = list(self._dirty)
+                self._dirty = dict()
+                marked = set()
+                for node in sources:
+                    marked.update(node._iseeker)
+                for seeker in self._order(sources):
+                    if seeker in marked:
+                        if seeker.update() and isinstance(seeker
+                         , BasicNode):
+                            marked.update(seeker._iseeker)
+                if len(self._listeners) > 0:
+                    self._touched.update(sources)
+                    self._touched.update(i for i in marked
+                     if isinstance(i, BasicNode))
+        finally:
+            self._depth -= 1
+        
+        if (len(self._touched) > 0) or (len(self._layouts) > 0):
+            (touched, layouts) = (self._touched, self._layouts)
+            self._touched = set()
+            self._layouts = set()
+            for listener in tuple(self._listeners):
+                listener(touched, layouts)
+
+
+_propagator = ChangePropagator()
+
+
+def addChangeListener(listener):
+    """Adds a listener for node changes (see
+    ChangePropagator.addListener).
+    """
+    _propagator.addListener(listener)
+
+
+def removeChangeListener(listener):
+    """Removes a listener added by `addChangeListener`.
+    """
+    _propagator.removeListener(listener)
+
+
+def transaction():
+    """Returns a context manager that batches node changes.
+    
+    All values set inside the *with* block will be propagated to
+    their info seekers when the (outermost) block ends.
+    
+    :returns: The ChangePropagator of this module.
+    """
+    return _propagator
+
+
 class BasicNode(object):
     """This is the root of all nodes and covers the very basics.
     
@@ -120,7 +390,7 @@ class BasicNode(object):
     
     _log = logging.getLogger(_LOGGER_NAME)
     __slots__ = ('help', '_name', '_overrider', '_flags', '_iseeker'
-               , '_status', '_value', '_unresolved_flags')
+               , '_status', '_value', '_unresolved_flags', '_disabled')
     
     def __init__(self, name, help=None, flags=None, **kgs):
         """Creates a new node with name 'name'.
@@ -135,6 +405,8 @@ class BasicNode(object):
         self._iseeker = set()
         self._status = 0
         self._value = None
+        self._disabled = None
+        # Cached result of isDisabled (None if unknown).
         
         if help is None:
             self.help = ""
@@ -193,6 +465,12 @@ class BasicNode(object):
                 flag_node = mod.getNode(flag)
                 self._flags.add(flag_node)
                 flag_node.addInfoSeeker(self)
+        self._unresolved_flags = set()
+        self._disabled = None
+    
+    def iterFlags(self):
+        """Yields all (resolved) flag nodes of this node."""
+        return iter(self._flags)
     
     def isOverriden(self):
         """This method returns if this node is overriden.
@@ -212,18 +490,19 @@ class BasicNode(object):
         """This method checks if the current node is disabled.
         
         Being disabled means that the input of this node is not needed.
+        The result will be cached until one of the flags changes.
         TODO: maybe also include unresolved flags...
         
         :returns: Returns True if this node really is disabled,
                   else False.
         """
-        for flag in self._flags:
-            if flag.isConfigured:
-                if not flag.readValue():
-                    return True
-            else:
-                return True
-        return False
+        if self._disabled is None:
+            self._disabled = False
+            for flag in self._flags:
+                if not (flag.isConfigured() and flag.readValue()):
+                    self._disabled = True
+                    break
+        return self._disabled
     
     def isConfigured(self):
         """This method checks if a value has been configured.
@@ -260,14 +539,22 @@ class BasicNode(object):
         """This method will notify all seeker objects in the list.
         
         This method should always be called if (f.e. the value of
-        this object changes).
+        this object changes). Inside a transaction, the seekers will
+        be notified when the transaction ends (see ChangePropagator).
         
         Note: This method won't be called by this class. It has to be
         implemented by subclasses.
         """
+        self._invalidate_seekers()
+        _propagator.changed(self)
+    
+    def _invalidate_seekers(self):
         
         for seeker in self._iseeker:
-            seeker.update()
+            if isinstance(seeker, BasicNode):
+                seeker._disabled = None
+            elif isinstance(seeker, ModuleNode):
+                seeker.update()
     
     def update(self):
         """This method could be called by notifyInfoSeeker.
@@ -275,10 +562,19 @@ class BasicNode(object):
         If this node has been added to some other node as info-seeker
         then this node will be informed (which means that this method
         will be called).
+        
+        :returns: True if the value (or status) of this node has
+                  changed (so its own seekers have to be updated).
         """
         if self._overrider:
+            changed = ((self._status != self._overrider._status)
+             or (self._value != self._overrider._value))
             self._status = self._overrider._status
             self._value = self._overrider._value
+            if changed:
+                self._invalidate_seekers()
+            return changed
+        return False
 
 
 class BasicChoice(BasicNode):
@@ -315,7 +611,7 @@ class BasicChoice(BasicNode):
         :returns: Returns value.
         """
         value = super().readValue()
-        if formatted and isinstance(self._format, collections.Callable):
+        if formatted and callable(self._format):
             return self._format(value)
         return value
     
@@ -341,7 +637,7 @@ class BasicChoice(BasicNode):
         :returns:     Returns True if value could be set, else False
                       (If for example check function returns False)
         """
-        if isinstance(self._check, collections.Callable):
+        if callable(self._check):
             if self._check(value):
                 self._configure_value(value)
                 return True
@@ -515,6 +811,7 @@ class BasicListChoice(BasicChoice):
         BasicChoice.__init__(self, name, **kargs)
         self._view = None
         self._list = tuple(ilist)
+        self._create_index()
         if viewlist is not None:
             tview = list(viewlist)
             if len(self._list) == len(tview):
@@ -527,6 +824,18 @@ class BasicListChoice(BasicChoice):
         if self._view is None:
             self._view = self._create_view_from_list()
     
+    def _create_index(self):
+        """Creates a dictionary that maps the (hashable) items of
+        self._list to their index (see `_find_index`).
+        """
+        self._index = dict()
+        self._unhashable = False
+        for (i, v) in enumerate(self._list):
+            try:
+                self._index.setdefault(v, i)
+            except TypeError:
+                self._unhashable = True
+    
     def _create_view_from_list(self):
         """Creates a sring list from self._list
         
@@ -564,6 +873,27 @@ class BasicListChoice(BasicChoice):
         """
         return self._view
     
+    def _find_index(self, value):
+        """Looks up the index of *value* in the list.
+        
+        Uses the index dictionary and only falls back to scanning
+        the list if *value* or some item isn't hashable.
+        
+        :param value: The value to look for.
+        :returns:     The index of the first equal item or None if
+                      the list doesn't contain *value*.
+        """
+        try:
+            index = self._index.get(value)
+            if (index is not None) or (not self._unhashable):
+                return index
+        except TypeError:
+            pass
+        for (i, v) in enumerate(self._list):
+            if v == value:
+                return i
+        return None
+    
     def _get_index(self, value):
         """This method tries to find *value* in list.
         
@@ -573,10 +903,10 @@ class BasicListChoice(BasicChoice):
                       index for.
         :returns:     The index of value (in the list).
         """
-        for (i, v) in enumerate(self._list):
-            if v == value:
-                return i
-        print("throw exception, or warning ListChoice.getIndex")
+        index = self._find_index(value)
+        if index is None:
+            print("throw exception, or warning ListChoice.getIndex")
+        return index
     
     def getList(self):
         """This method returns the real list of values that can
@@ -616,7 +946,7 @@ class ListChoice(BasicListChoice):
         :param value: Value to check.
         :returns:     True if value is on the list, else False.
         """
-        return (value in self._list)
+        return (self._find_index(value) is not None)
     
     def chooseByIndex(self, index):
         """Choose value by the index in self._list
@@ -684,7 +1014,7 @@ class MultiChoice(BasicListChoice):
         """
         
         for v in value:
-            if v not in self._list:
+            if self._find_index(v) is None:
                 return False
         return True
     
@@ -743,6 +1073,7 @@ class DependencyFrame(object):
     AVAILABLE = 2
     NEEDEXEC = 4
     EXECUTED = 8
+    REMOVED = 16
     
     def __init__(self, deps):
         """Initializes a new Frame.
@@ -770,7 +1101,7 @@ class DependencyFrame(object):
         :param func: This function will be called if all dependencies
                      are configured.
         """
-        if not isinstance(func, collections.Callable):
+        if not callable(func):
             raise TypeError("function (%s) isn't callable"
                  % str(func))
         else:
@@ -780,6 +1111,31 @@ class DependencyFrame(object):
     def getName(self):
         return self._name
     
+    def iterDependencies(self):
+        """Yields all dependencies that have already been resolved.
+        
+        :returns: The node objects this frame depends on.
+        """
+        for dep in self._deps:
+            if isinstance(dep, BasicNode):
+                yield dep
+    
+    def iterNodes(self):
+        """Yields all nodes that have been created by this frame."""
+        return iter(self._nodes.values())
+    
+    def iterSubFrames(self):
+        """Yields all frames that have been created by this frame."""
+        return iter(self._frames)
+    
+    def isRemoved(self):
+        """Returns if this frame has been removed (because its
+        parent frame has been executed again).
+        
+        :returns: True if this frame has been removed.
+        """
+        return (self._status & self.REMOVED == self.REMOVED)
+    
     def resolveDependencies(self, mod):
         """This method tries to find all nodes in 'deps'.
         
@@ -792,6 +1148,8 @@ class DependencyFrame(object):
         :param mod: The module node that includes this 
                     frame. (used to resolve dependencies).
         """
+        if self._status & self.RESOLVED:
+            return
         deps = list()
         for dep in self._deps:
             if (isinstance(dep, puser.Node)
@@ -918,16 +1276,162 @@ class DependencyFrame(object):
             
             self._frames = set()
             
-            self._func(*deps)
+            with transaction():
+                self._func(*deps)
             self._status |= (self.EXECUTED)
             self._status &= ~(self.NEEDEXEC)
         else:
             # TODO: Think about returning some value.
-            self._func(*deps)
+            with transaction():
+                self._func(*deps)
             self._status |= (self.EXECUTED)
             self._status &= ~(self.NEEDEXEC)
 
 
+def _frame_label(frame):
+    """Returns the name of *frame* for messages (its repr if the
+    frame doesn't have a name).
+    """
+    name = frame.getName()
+    if name is None:
+        return repr(frame)
+    return name
+
+
+class FrameScheduler(object):
+    """Executes the frames of one or more configure scripts.
+    
+    Frames will be executed in dependency order: A frame that
+    creates a node (or a sub-frame) will be executed before all
+    frames depending on that node (or the sub-frame itself). Since
+    executing frames creates new frames and changes values, this
+    will be repeated until no frame can be executed anymore.
+    """
+    
+    def __init__(self, max_rounds=_MAX_FRAME_ROUNDS):
+        """Initializes a new instance.
+        
+        :param max_rounds: Maximum number of rounds. If there are
+                           still frames to execute after that,
+                           FramesNotSettledError will be raised.
+        """
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self.max_rounds = max_rounds
+        self.cycles = list()
+    
+    def order(self, csfs):
+        """Sorts all frames topologically.
+        
+        Frames that are part of a cycle can't be sorted. They will
+        be appended (in the order they have been created) and the
+        cycles will be saved to *cycles*.
+        
+        :param csfs: List of ConfigScriptObj instances.
+        :returns:    List of (ConfigScriptObj, frame) tuples.
+        """
+        owner = dict()
+        frames = list()
+        for csf in csfs:
+            for frame in csf.frames:
+                owner[frame] = csf
+                frames.append(frame)
+        
+        producer = dict()
+        for frame in frames:
+            for node in frame.iterNodes():
+                producer[node] = frame
+            for sub in frame.iterSubFrames():
+                producer[sub] = frame
+        
+        edges = dict((frame, list()) for frame in frames)
+        pending = dict((frame, 0) for frame in frames)
+        for frame in frames:
+            before = set(producer.get(node)
+             for node in frame.iterDependencies())
+            before.add(producer.get(frame))
+            before.discard(None)
+            before.discard(frame)
+            for i in before:
+                if i in edges:
+                    edges[i].append(frame)
+                    pending[frame] += 1
+        
+        ordered = list()
+        ready = collections.deque(i for i in frames if pending[i] == 0)
+        while len(ready) > 0:
+            frame = ready.popleft()
+            ordered.append(frame)
+            for i in edges[frame]:
+                pending[i] -= 1
+                if pending[i] == 0:
+                    ready.append(i)
+        
+        left = [i for i in frames if pending[i] > 0]
+        self.cycles = list()
+        if len(left) > 0:
+            self.cycles = self._find_cycles(left, edges)
+            for cycle in self.cycles:
+                self._log.warning(_WARN_FRAME_CYCLE
+                 % " -> ".join(_frame_label(i) for i in cycle))
+            ordered.extend(left)
+        return [(owner[i], i) for i in ordered]
+    
+    def _find_cycles(self, frames, edges):
+        """Finds one cycle for each group of frames that couldn't
+        be sorted.
+        
+        :param frames: Frames that are (or depend on) a cycle.
+        :param edges:  Dictionary that maps each frame to the list
+                       of frames that depend on it.
+        :returns:      List of cycles (lists of frames).
+        """
+        left = set(frames)
+        cycles = list()
+        done = set()
+        for start in frames:
+            if start in done:
+                continue
+            path = list()
+            index = dict()
+            frame = start
+            while (frame not in index) and (frame not in done):
+                index[frame] = len(path)
+                path.append(frame)
+                frame = next((i for i in edges[frame] if i in left)
+                 , None)
+                if frame is None:
+                    break
+            if (frame is not None) and (frame in index):
+                cycles.append(path[index[frame]:] + [frame])
+            done.update(path)
+        return cycles
+    
+    def run(self, csfs):
+        """Executes all frames that can be executed.
+        
+        :param csfs: List of ConfigScriptObj instances.
+        :returns:    Number of executed frames.
+        """
+        executed = 0
+        for rounds in range(self.max_rounds):
+            count = 0
+            for (csf, frame) in self.order(csfs):
+                if (not frame.isRemoved()) and frame.canExecute():
+                    frame.executeFunction(csf)
+                    count += 1
+            if count == 0:
+                return executed
+            executed += count
+        
+        left = [frame for csf in csfs for frame in csf.frames
+         if frame.canExecute()]
+        if len(left) == 0:
+            return executed
+        self._log.error(_ERR_FRAMES_NOT_SETTLED
+         % (self.max_rounds, ", ".join(_frame_label(i) for i in left)))
+        raise FramesNotSettledError(left, cycles=self.cycles)
+
+
 class ConfigScriptObj(object):
     """This class executes the configure_xxx.py file.
     
@@ -946,20 +1450,24 @@ class ConfigScriptObj(object):
         self.ext_write = None
         self.frames = None
         self.config = None
+        self._overrides_resolved = 0
     
-    def executeScript(self, scriptfile, config):
+    def executeScript(self, scriptfile, config, ccache=None):
         """This method really runs the configure script.
         
         This should create all objects.
         
         :param scriptfile: Full path to the scriptfile.
         :param config:     Current configuartion.
+        :param ccache:     Optional peval.CodeCache that will be used
+                           to retrieve the compiled script.
         """
         self.nodes = dict()
         self.ext_write = list()
         self.frames = list()
         self.config = config
         self._current_frame = None
+        self._overrides_resolved = 0
         
         cfg = puser.ScriptObject(self)
         env = {'__builtins__' : __builtins__,
@@ -977,8 +1485,11 @@ class ConfigScriptObj(object):
         
         exec_env = ExecEnvironment(env, name=scriptfile)
         
-        with open(scriptfile, 'r') as f:
-            exec_env(f.read())
+        if ccache is None:
+            with open(scriptfile, 'r') as f:
+                exec_env(f.read())
+        else:
+            exec_env.execute(ccache.get(scriptfile, exec_env))
     
     def _check_new_name(self, name, list_to_check=None):
         """This method checks if 'name' is in a certain list.
@@ -998,18 +1509,34 @@ class ConfigScriptObj(object):
                  % (name, self._mod.uniquename()))
     
     def resolveDependencies(self):
+        """Resolves flags, frame dependencies and overrides.
         
+        Nodes and frames will only be resolved once, so calling this
+        method again only resolves what has been added since then.
+        """
         for node in self.nodes.values():
-            node.resolveFlags(self._mod)
+            self._resolve_node(node)
         
         for frame in self.frames:
             frame.resolveDependencies(self._mod)
         
-        for (ext, node) in self.ext_write:
+        self._resolve_overrides()
+    
+    def _resolve_node(self, node):
+        
+        node.resolveFlags(self._mod)
+        for flag in node.iterFlags():
+            # The module caches values depending on the flags.
+            flag.addInfoSeeker(self._mod)
+    
+    def _resolve_overrides(self):
+        
+        for (ext, node) in self.ext_write[self._overrides_resolved:]:
             extmod = self._mod.getUsedModule(ext)
             i_node = extmod.getNode(ext)
             o_node = self._mod.getNode(node)
             i_node.registerOverride(o_node)
+        self._overrides_resolved = len(self.ext_write)
     
     def installHook(self, frame):
         """Installs a hook.
@@ -1026,16 +1553,19 @@ class ConfigScriptObj(object):
         
         for name in names:
             self.nodes.pop(name, None)
+        self._mod.update()
+        _propagator.layoutChanged(self._mod)
     
     def removeFrames(self, frames):
         
         for frame in frames:
             self.frames.remove(frame)
+            frame._status |= frame.REMOVED
     
     def saveAllConfig(self):
         
         for (n, o) in self.nodes.items():
-            if (not o.isDisabled()) and (o.isConfigured):
+            if (not o.isDisabled()) and o.isConfigured():
                 self.config[n] = o.readValue()
     
     def _add_node(self, name, node):
@@ -1049,10 +1579,13 @@ class ConfigScriptObj(object):
         """
         
         self.nodes[name] = node
+        node.addInfoSeeker(self._mod)
+        self._mod.update()
+        _propagator.layoutChanged(self._mod)
         
         if self._current_frame is not None:
             self._current_frame.addNode(name, node)
-            self.resolveDependencies()
+            self._resolve_node(node)
         
         if isinstance(node, BasicChoice) and (name in self.config):
             node.setValue(self.config[name])
@@ -1066,7 +1599,7 @@ class ConfigScriptObj(object):
         
         if self._current_frame is not None:
             self._current_frame.addSubFrame(frame)
-            self.resolveDependencies()
+            frame.resolveDependencies(self._mod)
     
     def define(self, name, value, options):
         """Creates a simple constant value (C #define).
@@ -1179,6 +1712,8 @@ class ConfigScriptObj(object):
                 raise Exception("BAD")
             
             self.ext_write.append((ext, node))
+            if self._current_frame is not None:
+                self._resolve_overrides()
         else:
             raise TypeError(
                 "First parameter of override expects an ExternalNode")
@@ -1191,13 +1726,19 @@ class ModuleNode(object):
         self._rpath = relpath
         self._uname = _unique_name(name)
         self._realname = name
+        self._src = src
         self._basepath = os.path.join(src, relpath)
         self._log = logging.getLogger(_LOGGER_NAME)
         self._script_path = None
+        self._ext_cmds = None
         self._used_mods = list()
         # Will (directly) be used by ModuleManager
         self.targets = []
         self._cfg = None
+        self._version = 0
+        self._dicts = dict()
+        self._used_dicts = dict()
+        # Caches of getConfigDict (see update).
     
     def uniquename(self):
         return self._uname
@@ -1230,11 +1771,31 @@ class ModuleNode(object):
         self._script_path = os.path.join(self._basepath
             , _CFG_SCRIPTFILE % self._realname)
         commands = self._parse_extensions()
+        self._ext_cmds = commands
         
         for tup in commands:
             cmd, args = tup
             self._execute_ext_cmd(cmd, args, mods)
     
+    def scriptPath(self):
+        """Returns the path to the configure script.
+        
+        :returns: Full path to the script or None if this module
+                  hasn't been initialized yet.
+        """
+        return self._script_path
+    
+    def extensionsChanged(self):
+        """Checks if the extension commands of the script have
+        changed since this module has been initialized.
+        
+        If they have changed, all modules have to be initialized
+        again (since connections between modules may have changed).
+        
+        :returns: True if the extension commands have changed.
+        """
+        return self._parse_extensions() != self._ext_cmds
+    
     def _parse_extensions(self):
         
         with open(self._script_path, 'r') as scriptfile:
@@ -1317,21 +1878,49 @@ class ModuleNode(object):
             prepend = True
             self._log.info("Prepend will automatically be implied")
         
-        mod_config = dict()
-        for (name, node) in self._cfg.nodes.items():
-            if (node.isConfigured()) and (not node.isDisabled()):
-                if prepend:
-                    key = "%s_%s" % (self._uname, name)
-                else:
-                    key = name
-                mod_config[key] = node.readValue(formatted=formatted)
-        if inc_used:
+        if not inc_used:
+            return dict(self._cached_dict(formatted, prepend))
+        
+        key = (formatted, self._version) + tuple(used._version
+         for (used, name) in self._used_mods)
+        (old_key, mod_config) = self._used_dicts.get(formatted
+         , (None, None))
+        if old_key != key:
+            mod_config = dict(self._cached_dict(formatted, True))
             for used, name in self._used_mods:
-                cfg = used.getConfigDict(formatted=formatted
-                     , inc_used=False, prepend=True)
-                mod_config.update(cfg)
+                mod_config.update(used._cached_dict(formatted, True))
+            self._used_dicts[formatted] = (key, mod_config)
+        return dict(mod_config)
+    
+    def _cached_dict(self, formatted, prepend):
+        """Returns the (cached) config dictionary of this module.
+        
+        The returned dictionary is shared (by all modules that use
+        this one) and must not be changed.
+        """
+        mod_config = self._dicts.get((formatted, prepend))
+        if mod_config is None:
+            mod_config = dict()
+            for (name, node) in self._cfg.nodes.items():
+                if (node.isConfigured()) and (not node.isDisabled()):
+                    if prepend:
+                        key = "%s_%s" % (self._uname, name)
+                    else:
+                        key = name
+                    mod_config[key] = node.readValue(
+                        formatted=formatted)
+            self._dicts[(formatted, prepend)] = mod_config
         return mod_config
     
+    def update(self):
+        """Invalidates the cached config dictionaries.
+        
+        This module is an info seeker of all of its nodes (and their
+        flags), so this method will be called if one of them changes.
+        """
+        self._version += 1
+        self._dicts = dict()
+    
     def getDependencies(self):
         return (i for i in self._used_mods)
     
@@ -1381,38 +1970,114 @@ class ModuleNode(object):
     def getNodeNames(self):
         return tuple(self._cfg.nodes.keys())
     
-    def executeScript(self, config=dict()):
+    def setValues(self, values):
+        """Configures many nodes as one transaction.
+        
+        The changes will be propagated once, after all values have
+        been set (see `transaction`).
+        
+        :param values: Dictionary that maps node names to values.
+        :returns:      List of the names of all nodes whose value
+                       couldn't be set (because the node doesn't
+                       exist, it's not a choice or the check function
+                       failed).
+        """
+        failed = list()
+        with transaction():
+            for (name, value) in values.items():
+                node = self._cfg.nodes.get(name)
+                if not (isinstance(node, BasicChoice)
+                 and node.setValue(value)):
+                    failed.append(name)
+        return failed
+    
+    def executeScript(self, config=dict(), ccache=None):
         
         cfg = ConfigScriptObj(self)
-        cfg.executeScript(self._script_path, config)
+        cfg.executeScript(self._script_path, config, ccache=ccache)
         self._cfg = cfg
+        self.update()
+        _propagator.layoutChanged(self)
     
     def resolveNodes(self):
         
         # all modules must have been executed.
         self._cfg.resolveDependencies()
     
+    def getConfigScript(self):
+        """Returns the ConfigScriptObj of the executed script.
+        
+        :returns: The ConfigScriptObj or None if the script hasn't
+                  been executed yet.
+        """
+        return self._cfg
+    
     def executeFrames(self):
         
-        for frame in self._cfg.frames:
-            frame.executeFunction(self._cfg)
+        FrameScheduler().run([self._cfg])
     
-    def generateDst(self, dst, cbcfg=None):
+    def iterTargetNames(self):
+        """Yields all targets of this module.
         
-        env = {'__builtins__' : __builtins__, 'math' : math}
+        :returns: Paths of all targets (relative to the source
+                  directory).
+        """
+        for i in self.targets:
+            for name in i.iterNames():
+                yield name
+    
+    def iterTargetPaths(self, dst, only=None):
+        """Yields the paths of all targets.
+        
+        :param dst:  Destination path of the output directory.
+        :param only: Optional set of target paths (relative to the
+                     source directory). If set, only these targets
+                     will be returned.
+        :returns:    Tuples of the path in the source directory and
+                     the path in the output directory.
+        """
+        for relpath in self.iterTargetNames():
+            if (only is None) or (relpath in only):
+                yield (os.path.join(self._src, relpath)
+                 , os.path.join(dst, relpath))
+    
+    def generateDst(self, dst, cbcfg=None, only=None, tcache=None
+     , digests=None):
+        """Renders all targets of this module.
+        
+        Targets will be rendered from the source directory. Output
+        files will only be written if their content changes.
+        
+        :param dst:     Destination path of the output directory.
+        :param cbcfg:   Optional callback that will be called with the
+                        config dictionary after all targets have been
+                        rendered (f.e. to create C-Header files). It
+                        should return True if it has written a file.
+        :param only:    Optional set of target paths (relative to the
+                        source directory). If set, only these targets
+                        will be rendered.
+        :param tcache:  Optional peval.TemplateCache that will be used
+                        to retrieve compiled targets.
+        :param digests: Optional dictionary that maps source paths of
+                        targets to the hashes of their content (see
+                        poutput.fileHash), so they don't have to be
+                        read again to look up their templates.
+        :returns:       Number of files that have been written.
+        """
+        if digests is None:
+            digests = dict()
         cfg_dict = self.getConfigDict(formatted=True, inc_used=True
          , prepend=True)
-        env.update(cfg_dict)
         
-        for i in self.targets:
-            for (path, tget) in i.items(src=dst):
-                with open(path, 'r') as f:
-                    data = f.read()
-                with open(path, 'w') as f:
-                    parser = PyParser(f, env, name=path)
-                    parser.parseString(data)
-        if isinstance(cbcfg, collections.Callable):
-            cbcfg(self, dst, cfg_dict)
+        touched = 0
+        for (src_path, dst_path) in self.iterTargetPaths(dst, only=only):
+            if renderTarget(src_path, dst_path, cfg_dict, tcache=tcache
+             , digest=digests.get(src_path)):
+                touched += 1
+        if callable(cbcfg):
+            if cbcfg(self, dst, cfg_dict):
+                touched += 1
+        return touched
     
     def isFullyConfigured(self):
         """Checks if all nodes are configured.
@@ -1483,15 +2148,102 @@ class ModuleNode(object):
                     print("      - %s" % i, file=file)
 
 
+class DiscoveryIndex(object):
+    """This class remembers the layout of the source tree.
+    
+    For each directory the mtime, all configure scripts and all
+    sub-directories will be saved. The mtime of a directory changes
+    if entries are added, removed or renamed, so as long as it
+    doesn't change, the directory doesn't have to be listed again.
+    """
+    
+    def __init__(self, src=None):
+        """Initializes a new (empty) index.
+        
+        :param src: The source directory this index belongs to.
+        """
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self.src = src
+        self._dirs = dict()
+        self._seen = dict()
+    
+    @classmethod
+    def load(cls, path, src):
+        """Loads an index file.
+        
+        If the file doesn't exist, is outdated or belongs to some
+        other source directory, an empty index will be returned.
+        
+        :param path: Path to the index file.
+        :param src:  The source directory that will be used.
+        :returns:    A DiscoveryIndex instance.
+        """
+        index = cls(src)
+        if not os.path.isfile(path):
+            return index
+        try:
+            data = pfile.loadControlFile(path)
+        except ValueError:
+            index._log.warning("Ignoring invalid index '%s'." % path)
+            return index
+        if ((data.get('version') == DISCOVERY_VERSION)
+         and (data.get('src') == src)):
+            index._dirs = data.get('dirs', dict())
+        return index
+    
+    def save(self, path):
+        """Saves all directories that have been scanned (or looked
+        up) since this index has been loaded.
+        
+        :param path: Path to the index file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {'version' : DISCOVERY_VERSION, 'src' : self.src
+         , 'dirs' : self._seen}
+        pfile.saveControlFile(path, data)
+    
+    def scan(self, path, reldir):
+        """Returns the configure scripts and sub-directories of a
+        directory.
+        
+        The directory will only be listed if it isn't in the index
+        or its mtime has changed.
+        
+        :param path:   Full path to the directory.
+        :param reldir: Path relative to the source directory.
+        :returns:      A tuple of a sorted list of all configure
+                       scripts and a sorted list of all
+                       sub-directories (only names).
+        """
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._dirs.get(reldir)
+        if (entry is None) or (entry[0] != mtime):
+            scripts = list()
+            subdirs = list()
+            with os.scandir(path) as it:
+                for dirent in it:
+                    if dirent.is_dir():
+                        subdirs.append(dirent.name)
+                    elif _CFG_SCRIPTFILE_RE.match(dirent.name):
+                        scripts.append(dirent.name)
+            entry = [mtime, sorted(scripts), sorted(subdirs)]
+            self._dirs[reldir] = entry
+        self._seen[reldir] = entry
+        return (entry[1], entry[2])
+
+
 class ModuleManager(object):
     
-    def __init__(self, src):
+    def __init__(self, src, ccache=None):
         """Initializes a new instance.
         
-        :param src: The source directory where all modules
-                    can be found.
+        :param src:    The source directory where all modules
+                       can be found.
+        :param ccache: Optional peval.CodeCache that will be used
+                       to retrieve compiled configure scripts.
         """
         self._src = src
+        self._ccache = ccache
         self._mods = dict()
         self._log = logging.getLogger(_LOGGER_NAME)
         self._config = dict()
@@ -1509,17 +2261,107 @@ class ModuleManager(object):
         if config is not None:
             self._config = config
         
-        for (name, mod) in self._mods.items():
-            if name in self._config:
-                mod.executeScript(config[name])
-            else:
-                mod.executeScript()
+        with transaction():
+            for (name, mod) in self._mods.items():
+                mod.executeScript(self._config.get(name, dict())
+                 , ccache=self._ccache)
         
         for mod in self._mods.values():
             mod.resolveNodes()
         
-        for mod in self._mods.values():
-            mod.executeFrames()
+        self.executeFrames()
+    
+    def executeFrames(self):
+        """Executes the frames of all modules.
+        
+        Frames of all modules will be scheduled together, so frames
+        depending on nodes of other modules will be executed after
+        the frames that create them (see FrameScheduler).
+        
+        :returns: Number of executed frames.
+        """
+        csfs = list()
+        for name in sorted(self._mods.keys()):
+            csf = self._mods[name].getConfigScript()
+            if csf is not None:
+                csfs.append(csf)
+        return FrameScheduler().run(csfs)
+    
+    def _connected_modules(self, names):
+        """Returns all modules connected (by *use*) to *names*.
+        
+        Modules reference nodes of modules they use (and register
+        overrides), so they can only be executed again together.
+        
+        :param names: Names of modules.
+        :returns:     Set of the names of all modules that are
+                      (directly or indirectly) connected to *names*.
+        """
+        neighbours = dict((name, set()) for name in self._mods)
+        for (name, mod) in self._mods.items():
+            for (used, alias) in mod.getDependencies():
+                neighbours[name].add(used.uniquename())
+                neighbours[used.uniquename()].add(name)
+        
+        found = set()
+        stack = [i for i in names if i in self._mods]
+        while len(stack) > 0:
+            name = stack.pop()
+            if name not in found:
+                found.add(name)
+                stack.extend(neighbours[name] - found)
+        return found
+    
+    def reloadModules(self, names, config=None):
+        """Executes the scripts of some modules again.
+        
+        All modules connected to *names* (see `_connected_modules`)
+        will be executed again and their frames will be executed.
+        Other modules keep their nodes.
+        
+        :param names:  Names of the modules that have changed.
+        :param config: Optional new configuration (see `loadNodes`).
+        :returns:      Set of the names of all reloaded modules.
+        """
+        if config is not None:
+            self._config = config
+        
+        reloaded = self._connected_modules(names)
+        with transaction():
+            for name in sorted(reloaded):
+                self._mods[name].executeScript(self._config.get(name
+                 , dict()), ccache=self._ccache)
+        
+        for name in sorted(reloaded):
+            self._mods[name].resolveNodes()
+        
+        self.executeFrames()
+        return reloaded
+    
+    def setValues(self, values):
+        """Configures nodes of many modules as one transaction.
+        
+        After all values have been set, frames will be executed (see
+        `executeFrames`), so nodes depending on the new values will
+        be created.
+        
+        :param values: Dictionary that maps module names to
+                       dictionaries of node names and values (the
+                       same layout `collectConfig` returns).
+        :returns:      List of *module.node* names of all nodes whose
+                       value couldn't be set (see ModuleNode.setValues).
+        """
+        failed = list()
+        with transaction():
+            for (name, nodes) in values.items():
+                mod = self._mods.get(name)
+                if mod is None:
+                    failed.extend("%s.%s" % (name, i) for i in nodes)
+                else:
+                    failed.extend("%s.%s" % (name, i)
+                     for i in mod.setValues(nodes))
+        self.executeFrames()
+        return failed
     
     def collectConfig(self):
         """Collects current configuration.
@@ -1537,7 +2379,7 @@ class ModuleManager(object):
         
         return self._config
     
-    def initModules(self, targetlist):
+    def initModules(self, targetlist, ignore=(), index=None):
         """First loads all modules and afterwards initializes them.
         
         (Extension commands will be processed and connections to 
@@ -1550,12 +2392,36 @@ class ModuleManager(object):
         
         :param targetlist: This list contains the files to 
                            add (targets).
-        """
-        self._load_modules(targetlist, self._targets, '.')
+        :param ignore:     Shell-style patterns (see *fnmatch*) of
+                           directories that won't be searched for
+                           modules (and targets). A pattern will be
+                           matched against the name and the relative
+                           path of each directory.
+        :param index:      Optional DiscoveryIndex that will be used
+                           (and updated) to find all modules.
+        """
+        if index is None:
+            index = DiscoveryIndex(self._src)
+        visited = set()
+        self._load_modules(targetlist, self._targets, '.', ignore, index
+         , visited)
+        for tget in targetlist.iterDirs():
+            if tget.modulepath() not in visited:
+                warn(_WARN_TARGETS_IGNORED % tget.modulepath()
+                 , IgnoredTargetsWarning)
         for (name, mod) in self._mods.items():
             mod.initialize(self._src, self._mods)
     
-    def _load_modules(self, targetlist, parent, directory):
+    def _is_ignored(self, name, directory, ignore):
+        
+        for pattern in ignore:
+            if (fnmatch.fnmatch(name, pattern)
+             or fnmatch.fnmatch(directory, pattern)):
+                return True
+        return False
+    
+    def _load_modules(self, targetlist, parent, directory, ignore, index
+     , visited):
         """Loads all modules.
         
         This method will be recursively called for each subdirectory
@@ -1566,33 +2432,36 @@ class ModuleManager(object):
         :param parent:      The target list of a parent module.
                             (Note that this can also be 
                             ModuleManager._targets).
+        :param directory:   Path relative to the source directory.
+        :param ignore:      Patterns of directories to skip.
+        :param index:       The DiscoveryIndex.
+        :param visited:     Set of all directories that have been
+                            searched (will be updated).
         """
         directory = os.path.normpath(directory)
         path = os.path.join(self._src, directory)
-        found = False
-        subdirs = []
-        for filename in os.listdir(path):
-            fullpath = os.path.join(path, filename)
-            if os.path.isdir(fullpath):
-                subdirs.append(os.path.join(directory, filename))
-            else:
-                sf_match = _CFG_SCRIPTFILE_RE.match(filename)
-                if not (sf_match is None):
-                    if found:
-                        self._log.critical("only one configure-script" + 
-                            " per directory is allowed (%s)" % path)
-                        raise MoreThanOneModuleError(path)
-                    else:
-                        mod = self._add_module(sf_match.group(1), directory)
-                        parent = mod.targets
-                        found = True
+        visited.add(directory)
+        (scripts, subdirs) = index.scan(path, directory)
+        if len(scripts) > 1:
+            self._log.critical("only one configure-script" + 
+                " per directory is allowed (%s)" % path)
+            raise MoreThanOneModuleError(path)
+        elif len(scripts) == 1:
+            sf_match = _CFG_SCRIPTFILE_RE.match(scripts[0])
+            mod = self._add_module(sf_match.group(1), directory)
+            parent = mod.targets
         
         targets = targetlist.getTargetNode(directory)
         if not (targets is None):
             parent.append(targets)
         
-        for subs in subdirs:
-            self._load_modules(targetlist, parent, subs)
+        for name in subdirs:
+            subs = os.path.normpath(os.path.join(directory, name))
+            if self._is_ignored(name, subs, ignore):
+                self._log.debug("Ignoring directory '%s'." % subs)
+            else:
+                self._load_modules(targetlist, parent, subs, ignore
+                 , index, visited)
     
     def _add_module(self, name, relpath):
         """Adds a new module.
@@ -1659,8 +2528,7 @@ class ModuleManager(object):
         """
         ret = True
         
-        for mod in self._mods.values():
-            mod.executeFrames()
+        self.executeFrames()
         
         for mod in self._mods.values():
             if not mod.isFullyConfigured():
@@ -1671,12 +2539,112 @@ class ModuleManager(object):
                      , NotYetWorkingWarning)
         return ret
     
-    def generateOutput(self, dst, cbcfg=None):
+    def _render_parallel(self, dst, only, tcache, jobs, digests):
+        """Renders all targets using a pool of worker processes.
+        
+        Targets will be rendered in a well defined order. If some
+        targets fail, all errors will be logged and the first one
+        (in that order) will be raised.
+        
+        :param dst:     Destination path of the output directory.
+        :param only:    Optional set of target paths (see
+                        ModuleNode.generateDst).
+        :param tcache:  Optional peval.TemplateCache.
+        :param jobs:    Number of worker processes.
+        :param digests: Hashes of the sources (see
+                        ModuleNode.generateDst).
+        :returns:       Number of files that have been written.
+        """
+        cache_dir = None
+        if tcache is not None:
+            cache_dir = tcache.directory()
+        
+        work = list()
+        for name in sorted(self._mods.keys()):
+            mod = self._mods[name]
+            cfg_dict = mod.getConfigDict(formatted=True, inc_used=True
+             , prepend=True)
+            for paths in sorted(mod.iterTargetPaths(dst, only=only)):
+                work.append(paths + (cfg_dict, cache_dir
+                 , digests.get(paths[0])))
+        
+        # Imported here, it takes a while and is rarely needed.
+        from concurrent.futures import ProcessPoolExecutor
+        
+        touched = 0
+        errors = list()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_render_job, job) for job in work]
+            for future in futures:
+                try:
+                    if future.result():
+                        touched += 1
+                except (CodeEvalError, MissingClosingTagError) as e:
+                    self._log.error(_ERR_RENDER_FAILED
+                     % (e.name, e.line, str(e)))
+                    errors.append(e)
+        
+        if len(errors) > 0:
+            raise errors[0]
+        return touched
+    
+    def generateOutput(self, dst, cbcfg=None, manifest=None
+     , tcache=None, jobs=1, link=poutput.LINK_COPY):
+        """Generates the output directory.
+        
+        The output directory will be created (or updated, if it
+        already exists). Without a manifest, all files will be placed
+        in *dst* and all targets will be rendered. If a manifest is
+        passed, only files whose inputs have changed will be placed
+        and rendered again.
+        
+        :param dst:      Destination path of the output directory.
+        :param cbcfg:    Optional callback (see ModuleNode.generateDst).
+        :param manifest: Optional poutput.BuildManifest of the last
+                         build. It will be updated.
+        :param tcache:   Optional peval.TemplateCache.
+        :param jobs:     Number of processes used to render targets.
+        :param link:     How plain files will be placed in *dst* (see
+                         poutput.LINK_STRATEGIES).
+        :returns:        Number of rendered files that have been
+                         written (unchanged files won't be touched).
+        """
+        if manifest is None:
+            manifest = poutput.BuildManifest(dst)
+        
+        tgets = dict()
+        for mod in self._mods.values():
+            cfg_hash = poutput.configHash(mod.getConfigDict(
+                formatted=True, inc_used=True, prepend=True))
+            for relpath in mod.iterTargetNames():
+                tgets[relpath] = cfg_hash
+        
+        render = dict(poutput.syncTree(self._src, dst, tgets, manifest
+         , link=link))
+        only = set(render.keys())
+        digests = dict((os.path.join(self._src, relpath), src_hash)
+         for (relpath, src_hash) in render.items())
+        
+        touched = 0
+        if jobs > 1:
+            touched += self._render_parallel(dst, only, tcache, jobs
+             , digests)
+            if callable(cbcfg):
+                for mod in self._mods.values():
+                    if cbcfg(mod, dst, mod.getConfigDict(formatted=True
+                     , inc_used=True, prepend=True)):
+                        touched += 1
+        else:
+            for mod in self._mods.values():
+                touched += mod.generateDst(dst, cbcfg=cbcfg, only=only
+                 , tcache=tcache, digests=digests)
         
-        shutil.copytree(self._src, dst)
+        for (relpath, src_hash) in render.items():
+            manifest.setTarget(relpath, src_hash, tgets[relpath])
         
-        for mod in self._mods.values():
-            mod.generateDst(dst, cbcfg=cbcfg)
+        self._log.info("Rendered %d target(s), %d file(s) written."
+         % (len(render), touched))
+        return touched
     
     def dump(self):
         """Dumps current module-list.
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module is about generating the output tree.
+
+The **make** command copies (or links) the source tree to the
+destination directory and renders all targets. To avoid doing all the
+work on each run, a build manifest can be used. It remembers what has been
+written to the output directory the last time, so only files whose
+inputs have changed have to be copied (or rendered) again.
+"""
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+import pfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from peval import PARSER_VERSION
+
+
+__author__ = 'Manuel Huber'
+__copyright__ = "Copyright (c) 2011 Manuel Huber."
+__license__ = 'GPLv3'
+__docformat__ = "restructuredtext en"
+
+MANIFEST_VERSION = 1
+# Will be increased if the layout of the manifest changes.
+
+LINK_COPY = 'copy'
+LINK_HARD = 'hardlink'
+LINK_REFLINK = 'reflink'
+LINK_STRATEGIES = (LINK_COPY, LINK_HARD, LINK_REFLINK)
+# Strategies to place plain (non-target) files in the output directory.
+
+_LOGGER_NAME = 'output'
+_FICLONE = 0x40049409
+# ioctl request to clone a file (linux/fs.h).
+_HASH_BLOCK_SIZE = 1 << 16
+
+
+def fileHash(path):
+    """Calculates the hash of the content of a file.
+    
+    :param path: Path to the file.
+    :returns:    Hex digest of the file content.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        block = f.read(_HASH_BLOCK_SIZE)
+        while len(block) > 0:
+            digest.update(block)
+            block = f.read(_HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+def configHash(cfgdict):
+    """Calculates the hash of a (formatted) config dictionary.
+    
+    Values that can't be represented as json will be hashed by
+    their *repr*.
+    
+    :param cfgdict: The config dictionary of a module.
+    :returns:       Hex digest of the config dictionary.
+    """
+    data = json.dumps(cfgdict, sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _file_signature(path):
+    """Returns a cheap signature (size and mtime) of a file.
+    
+    :param path: Path to the file.
+    """
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _iter_tree(src):
+    """Yields all directories of the source tree and their files.
+    
+    Symbolic links to directories will be followed (just like
+    *shutil.copytree* does).
+    
+    :param src: The source directory.
+    :returns:   Tuples of the relative path of the directory and a
+                sorted list of all file names in that directory.
+    """
+    for (dirpath, dirnames, filenames) in os.walk(src, followlinks=True):
+        dirnames.sort()
+        reldir = os.path.normpath(os.path.relpath(dirpath, src))
+        yield (reldir, sorted(filenames))
+
+
+def _reflink(src_path, dst_path):
+    """Tries to create a copy-on-write clone of a file.
+    
+    This only works on Linux and file systems that support it
+    (f.e. btrfs or xfs).
+    
+    :param src_path: Path of the existing file.
+    :param dst_path: Path of the clone.
+    :returns:        True on success, else False.
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(src_path, 'rb') as s:
+            with open(dst_path, 'wb') as d:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    except OSError:
+        return False
+    shutil.copystat(src_path, dst_path)
+    return True
+
+
+def placeFile(src_path, dst_path, link=LINK_COPY):
+    """Places a file in the output directory.
+    
+    An existing file at *dst_path* will always be removed first, so
+    data will never be written through an old (hard) link into some
+    other file (f.e. the source).
+    If the file can't be linked (f.e. because *src_path* and
+    *dst_path* are on different devices), it will be copied.
+    
+    :param src_path: Path to the source file.
+    :param dst_path: Path in the output directory.
+    :param link:     One of LINK_STRATEGIES.
+    """
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    
+    if link == LINK_HARD:
+        try:
+            os.link(src_path, dst_path)
+            return
+        except OSError:
+            pass
+    elif link == LINK_REFLINK:
+        if _reflink(src_path, dst_path):
+            return
+    shutil.copy2(src_path, dst_path)
+
+
+class BuildManifest(object):
+    """This class remembers the state of the output directory.
+    
+    For each plain file the size and mtime of the source will be
+    saved. For targets, the hash of the source, the hash of the
+    config dictionary of the module and the parser version will be
+    saved. If one of them changes, the target has to be rendered
+    again.
+    """
+    
+    def __init__(self, dst=None):
+        """Initializes a new (empty) manifest.
+        
+        :param dst: The output directory this manifest belongs to.
+        """
+        self._log = logging.getLogger(_LOGGER_NAME)
+        self.dst = dst
+        self._files = dict()
+        self._targets = dict()
+    
+    @classmethod
+    def load(cls, path, dst):
+        """Loads a manifest file.
+        
+        If the file doesn't exist, is outdated or belongs to some
+        other output directory, an empty manifest will be returned.
+        
+        :param path: Path to the manifest file.
+        :param dst:  The output directory that will be used.
+        :returns:    A BuildManifest instance.
+        """
+        manifest = cls(dst)
+        if not os.path.isfile(path):
+            return manifest
+        try:
+            data = pfile.loadControlFile(path)
+        except ValueError:
+            manifest._log.warning("Ignoring invalid manifest '%s'." % path)
+            return manifest
+        if ((data.get('version') == MANIFEST_VERSION)
+         and (data.get('dst') == dst)):
+            manifest._files = data.get('files', dict())
+            manifest._targets = data.get('targets', dict())
+        return manifest
+    
+    def save(self, path):
+        """Saves this manifest.
+        
+        :param path: Path to the manifest file.
+        """
+        data = {'version' : MANIFEST_VERSION, 'dst' : self.dst
+         , 'files' : self._files, 'targets' : self._targets}
+        pfile.saveControlFile(path, data)
+    
+    def fileChanged(self, relpath, signature):
+        """Checks if a plain file has changed since the last build.
+        
+        :param relpath:   Path relative to the source directory.
+        :param signature: Current signature of the source file.
+        :returns:         True if the file has to be copied.
+        """
+        return self._files.get(relpath) != signature
+    
+    def targetChanged(self, relpath, src_hash, cfg_hash):
+        """Checks if a target has to be rendered again.
+        
+        :param relpath:  Path relative to the source directory.
+        :param src_hash: Current hash of the source file.
+        :param cfg_hash: Current hash of the config dictionary.
+        :returns:        True if the target has to be rendered.
+        """
+        entry = [src_hash, cfg_hash, PARSER_VERSION]
+        return self._targets.get(relpath) != entry
+    
+    def setFile(self, relpath, signature):
+        self._targets.pop(relpath, None)
+        self._files[relpath] = signature
+    
+    def setTarget(self, relpath, src_hash, cfg_hash):
+        self._files.pop(relpath, None)
+        self._targets[relpath] = [src_hash, cfg_hash, PARSER_VERSION]
+    
+    def removeStale(self, existing):
+        """Removes all entries that are not in *existing*.
+        
+        :param existing: Set of relative paths that still exist.
+        :returns:        List of relative paths that have been removed.
+        """
+        stale = [i for i in self._files if i not in existing]
+        stale.extend(i for i in self._targets if i not in existing)
+        for relpath in stale:
+            self._files.pop(relpath, None)
+            self._targets.pop(relpath, None)
+        return stale
+
+
+def replaceFile(path, data, mode_from=None):
+    """Replaces the content of a file (if it has changed).
+    
+    The existing file will only be replaced if its size or content
+    differs from *data*, so the mtime of unchanged files is kept.
+    The new content will be written to a temporary file in the same
+    directory which will atomically be renamed to *path*.
+    
+    :param path:      Path of the file to write.
+    :param data:      The new content (string).
+    :param mode_from: Optional path of a file whose permission bits
+                      will be copied.
+    :returns:         True if the file has been written, else False.
+    """
+    data = data.encode(pfile.ENCODING)
+    try:
+        if os.stat(path).st_size == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+    
+    return pfile.writeFile(path, data, sync=False, mode_from=mode_from
+     , follow_links=False)
+
+
+def replaceFileStream(path, write, mode_from=None):
+    """Replaces the content of a file with streamed output.
+    
+    Works like `replaceFile`, but the content doesn't have to fit
+    into memory: *write* writes it to the temporary file which will
+    then be compared (block by block) to the existing file.
+    
+    :param path:      Path of the file to write.
+    :param write:     Callable that writes the new content to the
+                      text file object it gets.
+    :param mode_from: Optional path of a file whose permission bits
+                      will be copied.
+    :returns:         True if the file has been written, else False.
+    """
+    def write_text(f):
+        text = io.TextIOWrapper(f, encoding=pfile.ENCODING, newline='')
+        write(text)
+        text.flush()
+        text.detach()
+    
+    return pfile.writeFile(path, write_text, sync=False
+     , mode_from=mode_from, compare=True, follow_links=False)
+
+
+def syncTree(src, dst, targets, manifest, link=LINK_COPY):
+    """Updates the output directory *dst*.
+    
+    All plain files that have changed (according to *manifest*) will
+    be placed in the output directory (see `placeFile`). Targets
+    won't be placed at all, they have to be rendered from the source
+    (if the source or the config hash has changed). Files that don't
+    exist anymore will be removed from the output directory.
+    
+    :param src:      The source directory.
+    :param dst:      The output directory (will be created if it
+                     doesn't exist).
+    :param targets:  A dictionary that maps the relative path of
+                     each target to the config hash of its module.
+    :param manifest: The BuildManifest of the last build.
+    :param link:     Strategy used for plain files (one of
+                     LINK_STRATEGIES).
+    :returns:        A list of (relative path, source hash) tuples of
+                     all targets that have to be rendered.
+    """
+    log = logging.getLogger(_LOGGER_NAME)
+    render = list()
+    existing = set()
+    placed = 0
+    
+    for (reldir, names) in _iter_tree(src):
+        os.makedirs(os.path.join(dst, reldir), exist_ok=True)
+        for name in names:
+            relpath = os.path.normpath(os.path.join(reldir, name))
+            existing.add(relpath)
+            src_path = os.path.join(src, relpath)
+            dst_path = os.path.join(dst, relpath)
+            missing = not os.path.isfile(dst_path)
+            
+            if relpath in targets:
+                src_hash = fileHash(src_path)
+                if (missing or manifest.targetChanged(relpath, src_hash
+                 , targets[relpath])):
+                    render.append((relpath, src_hash))
+            else:
+                sig = _file_signature(src_path)
+                if missing or manifest.fileChanged(relpath, sig):
+                    manifest.setFile(relpath, sig)
+                    placeFile(src_path, dst_path, link=link)
+                    placed += 1
+    
+    for relpath in manifest.removeStale(existing):
+        dst_path = os.path.join(dst, relpath)
+        if os.path.isfile(dst_path):
+            log.debug("Removing stale file '%s'." % dst_path)
+            os.remove(dst_path)
+    
+    log.info("Placed %d file(s), %d target(s) have to be rendered."
+     % (placed, len(render)))
+    return render
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of frames that create lots of nodes.
+
+Creates a module whose configure script contains a single frame that
+generates a given number of nodes (each one using the frame's
+dependency as flag) and measures how long it takes to execute the
+script and the frame. The time per node should stay (roughly) the
+same, no matter how many nodes are created.
+
+Usage: benchframes.py [number of nodes]
+"""
+
+from os.path import split, join, normpath
+import os
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+
+_SCRIPT = """
+n = cfg.single("N", [1, 2])
+
+@cfg.depends(n)
+def generate(value):
+    for i in range(%d):
+        cfg.define("D%%d" %% i, i, flags=[n])
+"""
+
+
+def _bench_frame(count):
+    tmp = tempfile.mkdtemp()
+    try:
+        os.mkdir(join(tmp, 'mod'))
+        with open(join(tmp, 'mod', 'configure_mod.py'), 'w') as f:
+            f.write(_SCRIPT % count)
+        mod = pmodules.ModuleNode(tmp, 'mod', 'mod')
+        mod.initialize(tmp, dict())
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                mod.executeScript({'N' : 1})
+                mod.resolveNodes()
+                mod.executeFrames()
+        elapsed = time.perf_counter() - start
+        return (elapsed, len(mod.getNodeNames()))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def main(count=10000):
+    for fraction in (8, 4, 2, 1):
+        elapsed, nodes = _bench_frame(count // fraction)
+        print("%7d nodes: %7.3f s (%.2f us/node)"
+         % (nodes, elapsed, elapsed * 1e6 / nodes))
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pmodules
+    main(*[int(i) for i in sys.argv[1:2]])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the PyParser tokenizer.
+
+Generates files of different sizes (with a proportional number of
+inline code tags) and measures how long it takes to split them into
+literal chunks and code blocks. The time per MB should stay (roughly)
+the same, no matter how big the file is.
+
+Usage: benchpeval.py [size in MB] [number of tags]
+"""
+
+from os.path import split, join, normpath
+import sys
+import time
+
+
+def _create_data(size, tags):
+    """Creates a file with *tags* tags and (about) *size* bytes.
+    
+    :param size: Size of the data in bytes.
+    :param tags: Number of inline code tags.
+    """
+    tag = "<?py:echo(A)?>"
+    filler = size // tags - len(tag)
+    line = "x" * 79 + "\n"
+    chunk = (line * (filler // len(line) + 1))[:filler]
+    return (chunk + tag) * tags
+
+
+def _bench_tokenize(data):
+    parser = PyParser(None, dict(), name='bench')
+    start = time.perf_counter()
+    count = 0
+    for (is_code, chunk, line) in parser._tokenize(data):
+        if is_code:
+            count += 1
+    return (time.perf_counter() - start, count)
+
+
+def main(size_mb=50, tags=100000):
+    for fraction in (8, 4, 2, 1):
+        size = size_mb * (1 << 20) // fraction
+        data = _create_data(size, tags // fraction)
+        elapsed, count = _bench_tokenize(data)
+        print("%8.2f MB %7d tags: %7.3f s (%.4f s/MB)"
+         % (len(data) / float(1 << 20), count, elapsed
+         , elapsed / (len(data) / float(1 << 20))))
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    from peval import PyParser
+    main(*[int(i) for i in sys.argv[1:3]])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the startup time of all subcommands.
+
+Creates a small project in a temporary directory and runs each
+(non-interactive) subcommand several times in a fresh interpreter.
+The best wall clock time will be reported. None of these commands
+needs the gui, so if one of them imports tkinter (or fails), the
+benchmark fails (exit status 1).
+
+Usage: benchstartup.py [number of runs]
+"""
+
+from os.path import split, join, normpath, abspath
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+_SCRIPT = "x = cfg.input('X', type='int')\n"
+_TARGET = "x = <?py:echo(MOD_X)?>\n"
+
+_COMMANDS = (('setup', '-i'), ('status',), ('add', 'src/mod/t.txt')
+ , ('rm', 'src/mod/t.txt'), ('set', 'mod.X=3'), ('make', '-n'))
+
+
+def _run(main, cwd, args):
+    """Runs pconfig in a new interpreter.
+    
+    :param main: Path to the start script.
+    :param cwd:  Directory of the project.
+    :param args: Arguments of the subcommand.
+    :returns:    Tuple of the elapsed time, a flag that indicates
+                 whether tkinter has been imported and an error
+                 message (None if the command succeeded).
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', main]
+     + list(args), cwd=cwd, stdout=subprocess.DEVNULL
+     , stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    lines = proc.stderr.splitlines()
+    tk = any(i.rstrip().endswith('| tkinter') for i in lines)
+    error = None
+    if proc.returncode != 0:
+        output = [i for i in lines if not i.startswith('import time:')]
+        error = "exit status %d%s" % (proc.returncode
+         , (": " + output[-1]) if len(output) > 0 else "")
+    return (elapsed, tk, error)
+
+
+def _create_project(main, base):
+    os.makedirs(join(base, 'src', 'mod'))
+    with open(join(base, 'src', 'mod', 'configure_mod.py'), 'w') as f:
+        f.write(_SCRIPT)
+    with open(join(base, 'src', 'mod', 't.txt'), 'w') as f:
+        f.write(_TARGET)
+    for args in (('setup',), ('add', 'src/mod/t.txt')
+     , ('set', 'mod.X=1')):
+        error = _run(main, base, args)[2]
+        if error is not None:
+            raise RuntimeError("'%s' failed (%s)" % (" ".join(args), error))
+
+
+def main(main_path, runs=5):
+    tmp = tempfile.mkdtemp()
+    failed = False
+    try:
+        _create_project(main_path, tmp)
+        for args in _COMMANDS:
+            times = list()
+            for i in range(runs):
+                elapsed, tk, error = _run(main_path, tmp, args)
+                if error is not None:
+                    break
+                times.append(elapsed)
+                if args[0] == 'rm':
+                    _run(main_path, tmp, ('add',) + args[1:])
+            if error is not None:
+                print("%-24s failed (%s)" % (" ".join(args), error))
+            else:
+                print("%-24s %7.1f ms%s" % (" ".join(args)
+                 , min(times) * 1000, "  (imports tkinter!)" if tk else ""))
+            failed = failed or tk or (error is not None)
+    finally:
+        shutil.rmtree(tmp)
+    return failed
+
+
+if __name__ == '__main__':
+    base = split(abspath(sys.argv[0]))[0]
+    path = normpath(join(base, "../src/__main__.py"))
+    if main(path, *[int(i) for i in sys.argv[1:2]]):
+        sys.exit(1)
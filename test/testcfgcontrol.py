@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+_SCRIPT = """
+a = cfg.input('A', type='int')
+b = cfg.input('B', flags=[a])
+for i in range(1000):
+    cfg.input('N%d' % i)
+
+@cfg.depends(a)
+def generate(value):
+    for i in range(int(value)):
+        cfg.define('D%d' % i, i)
+"""
+
+
+class _Gui(object):
+    
+    def __init__(self, controller):
+        self.calls = list()
+        self.run = None
+    
+    def mainloop(self):
+        self.run()
+    
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name,) + args)
+
+
+class TestConfigController(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        os.mkdir(join(self._tmp, 'mod'))
+        with open(join(self._tmp, 'mod', 'configure_mod.py'), 'w') as f:
+            f.write(_SCRIPT)
+        self._null = open(os.devnull, 'w')
+        self._redirect = contextlib.redirect_stdout(self._null)
+        self._redirect.__enter__()
+        man = pmodules.ModuleManager(self._tmp)
+        man.initModules(targets.TargetTree(self._tmp))
+        man.loadNodes()
+        self._ctrl = cfgcontrol.ConfigController(_Gui, man)
+        self._gui = self._ctrl._gui
+    
+    def _run(self, steps):
+        self._gui.run = steps
+        self._ctrl.mainloop()
+    
+    def _set(self, node, value):
+        self._ctrl.chooseNode(node)
+        del self._gui.calls[:]
+        self._ctrl.setChoice(value)
+        return [i for i in self._gui.calls if i[0].startswith('update')]
+    
+    def test_colors(self):
+        def steps():
+            self._ctrl.chooseModule('MOD')
+            names = self._gui.calls[-1][1]
+            calls = self._set('N5', 'x')
+            self.assertEqual(calls, [('updateNodeColors'
+             , {names.index('N5') : 'green'})])
+            calls = self._set('A', '0')
+            self.assertEqual(calls, [('updateNodeColors'
+             , {names.index('A') : 'green', names.index('B') : 'black'})])
+        self._run(steps)
+    
+    def test_layout(self):
+        def steps():
+            self._ctrl.chooseModule('MOD')
+            calls = self._set('A', '2')
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(calls[0][0], 'updateNodes')
+            names = calls[0][1]
+            self.assertIn('D1', names)
+            calls = self._set('B', 'x')
+            self.assertEqual(calls, [('updateNodeColors'
+             , {names.index('B') : 'green'})])
+        self._run(steps)
+    
+    def test_listener(self):
+        node = self._ctrl._mman.getModule('MOD').getNode('N1')
+        def steps():
+            self._ctrl.chooseModule('MOD')
+            node.setValue('x')
+            self.assertEqual(self._ctrl._touched, {node})
+            self._ctrl._touched.clear()
+        self._run(steps)
+        node.setValue('y')
+        other = cfgcontrol.ConfigController(_Gui, self._ctrl._mman)
+        other.chooseModule('MOD')
+        node.setValue('z')
+        self.assertEqual(self._ctrl._touched, set())
+        self.assertEqual(other._touched, set())
+    
+    def tearDown(self):
+        self._redirect.__exit__(None, None, None)
+        self._null.close()
+        shutil.rmtree(self._tmp)
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pmodules
+    import targets
+    import cfgcontrol
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import sys
+import unittest
+
+class _Listbox(object):
+    
+    def __init__(self, selectmode='single'):
+        self.rows = list()
+        self.selectmode = selectmode
+        self.calls = 0
+    
+    def configure(self, **kargs):
+        pass
+    
+    def bind(self, sequence, func):
+        pass
+    
+    def winfo_height(self):
+        return 1
+    
+    def cget(self, name):
+        return {'height' : '5', 'selectmode' : self.selectmode}[name]
+    
+    def _index(self, index):
+        if index == 'end':
+            return len(self.rows)
+        return int(index)
+    
+    def insert(self, index, text):
+        self.calls += 1
+        self.rows.insert(self._index(index), [text, None, False])
+    
+    def delete(self, first, last=None):
+        self.calls += 1
+        first = self._index(first)
+        last = first + 1 if last is None else self._index(last)
+        del self.rows[first:last]
+    
+    def itemconfig(self, index, foreground):
+        self.calls += 1
+        self.rows[index][1] = foreground
+    
+    def selection_includes(self, index):
+        return self.rows[index][2]
+    
+    def selection_set(self, index):
+        self.calls += 1
+        self.rows[index][2] = True
+    
+    def selection_clear(self, index):
+        self.calls += 1
+        self.rows[index][2] = False
+    
+    def curselection(self):
+        return tuple(i for (i, row) in enumerate(self.rows) if row[2])
+
+
+class _Scrollbar(object):
+    
+    def configure(self, **kargs):
+        pass
+    
+    def set(self, first, last):
+        self.view = (first, last)
+
+
+class TestVirtualList(unittest.TestCase):
+    
+    def setUp(self):
+        self._lb = _Listbox()
+        self._scl = _Scrollbar()
+        self._vl = pbgui_imp.VirtualList(self._lb, self._scl)
+        self._items = ["N%d" % i for i in range(10000)]
+    
+    def test_visible_rows(self):
+        self._vl.setItems(self._items, ['black'] * 10000)
+        self.assertEqual([i[0] for i in self._lb.rows]
+         , ['N0', 'N1', 'N2', 'N3', 'N4'])
+        self._vl.yview('moveto', '0.5')
+        self.assertEqual(self._lb.rows[0], ['N5000', 'black', False])
+        self.assertEqual(self._scl.view, (0.5, 0.5005))
+        self._vl.yview('scroll', '1', 'pages')
+        self.assertEqual(self._lb.rows[0][0], 'N5003')
+        self._vl.yview('moveto', '1.0')
+        self.assertEqual(self._lb.rows[-1][0], 'N9999')
+    
+    def test_color_diff(self):
+        colors = ['black'] * 10000
+        self._vl.setItems(self._items, colors)
+        self._lb.calls = 0
+        colors = list(colors)
+        colors[1] = 'green'
+        colors[500] = 'green'
+        self._vl.setItems(self._items, colors, keep=True)
+        self.assertEqual(self._lb.calls, 1)
+        self.assertEqual(self._lb.rows[1], ['N1', 'green', False])
+    
+    def test_selection(self):
+        self._vl.setItems(self._items, selected=[2])
+        self._vl.yview('moveto', '0.5')
+        self.assertEqual(self._lb.curselection(), ())
+        self._lb.selection_set(1)
+        self._vl.syncSelection()
+        self.assertEqual(self._vl.selection(), [5001])
+        self._vl.setItems(self._items[1:], keep=True)
+        self.assertEqual(self._vl.selection(), [5000])
+        self._vl.see(3)
+        self.assertEqual(self._lb.rows[0][0], 'N4')
+        self.assertEqual(self._lb.curselection(), ())
+    
+    def test_multiple(self):
+        self._lb.selectmode = 'multiple'
+        self._vl.setItems(self._items, selected=[1, 9000])
+        self.assertEqual(self._lb.curselection(), (1,))
+        self._lb.selection_set(3)
+        self._vl.syncSelection()
+        self.assertEqual(self._vl.selection(), [1, 3, 9000])
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pbgui_imp
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath, abspath
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+import contextlib
+import subprocess
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_SCRIPT = "cfg.input('X')\n"
+_TARGET = "x = <?py:echo(MOD_X)?>\n"
+
+
+class _Project(unittest.TestCase):
+    
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.mkdtemp()
+        os.makedirs(join(self._tmp, 'src', 'mod'))
+        with open(join(self._tmp, 'src', 'mod', 'configure_mod.py')
+         , 'w') as f:
+            f.write(_SCRIPT)
+        with open(join(self._tmp, 'src', 'mod', 't.txt'), 'w') as f:
+            f.write(_TARGET)
+        os.chdir(self._tmp)
+        self._run('setup')
+        self._run('add', 'src/mod/t.txt')
+    
+    def _run(self, *args):
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                pconfig.main(['pconfig'] + list(args), logging.ERROR)
+    
+    def _read(self, *path):
+        with open(join(self._tmp, *path)) as f:
+            return f.read()
+    
+    def tearDown(self):
+        os.chdir(self._cwd)
+        shutil.rmtree(self._tmp)
+
+
+class TestMake(_Project):
+    
+    def test_incremental(self):
+        for (value, args) in (('xxx', ('-i',)), ('yyy', ())
+         , ('xxx', ('-i',)), ('yyy', ('-i',)), ('xxx', ())):
+            self._run('set', 'mod.X=%s' % value)
+            self._run('make', '-n', *args)
+            self.assertEqual(self._read('out', 'mod', 't.txt')
+             , "x = %s\n" % value)
+    
+    def test_matrix(self):
+        os.mkdir('matrix')
+        for value in ('a', 'b'):
+            self._run('set', 'mod.X=%s' % value, '-o'
+             , join('matrix', '%s.jso' % value))
+        # Named like a directory of the source tree.
+        os.rename(join('matrix', 'b.jso'), join('matrix', 'mod.jso'))
+        self._run('set', 'mod.X=x')
+        self._run('make', '-n', '-i')
+        files = sorted(os.listdir(join(self._tmp, 'out', 'mod')))
+        self._run('make', '-n', '-m', 'matrix')
+        self.assertEqual(self._read('out.matrix', 'a', 'mod', 't.txt')
+         , "x = a\n")
+        self.assertEqual(self._read('out.matrix', 'mod', 'mod', 't.txt')
+         , "x = b\n")
+        self.assertEqual(sorted(os.listdir(join(self._tmp, 'out', 'mod')))
+         , files)
+        self.assertEqual(self._read('out', 'mod', 't.txt'), "x = x\n")
+        self._run('make', '-n', '-m', 'matrix', '--matrix-out', 'variants')
+        self.assertEqual(sorted(os.listdir(join(self._tmp, 'variants')))
+         , ['a', 'mod'])
+
+
+class TestSet(_Project):
+    
+    def _config(self):
+        return json.loads(self._read('.pconfig', 'current-config.jso'))
+    
+    def _overlay(self, name, data):
+        with open(join(self._tmp, name), 'w') as f:
+            f.write(data)
+        self._run('set', '-f', name)
+        return self._config()['MOD']['X']
+    
+    def test_overlay(self):
+        self.assertEqual(self._overlay('a.ini', "[mod]\nX = ini\n"), 'ini')
+        self.assertEqual(self._overlay('b.json', '{"Mod" : {"X" : "json"}}')
+         , 'json')
+    
+    def test_assignment(self):
+        self._run('set', 'mod.X=[1, 2]')
+        self.assertEqual(self._config()['MOD']['X'], [1, 2])
+        self._run('set', ' Mod .X=abc')
+        self.assertEqual(self._config()['MOD']['X'], 'abc')
+    
+    def test_failed(self):
+        self._run('set', 'mod.X=abc')
+        config = self._read('.pconfig', 'current-config.jso')
+        for args in (('mod.X=x', 'mod.Y=y'), ('other.X=x',), ('modX=x',)):
+            self._run('set', *args)
+            self.assertEqual(self._read('.pconfig', 'current-config.jso')
+             , config)
+
+
+@unittest.skipIf(fcntl is None, "fcntl isn't available")
+class TestLock(_Project):
+    
+    def _start(self, *args, timeout=10):
+        main = join(split(pconfig.__file__)[0], '__main__.py')
+        return subprocess.run([sys.executable, main] + list(args)
+         , stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+         , timeout=timeout).returncode
+    
+    def _hold(self, op):
+        f = open(join(self._tmp, '.pconfig', 'lock'), 'ab')
+        self.addCleanup(f.close)
+        fcntl.flock(f.fileno(), op)
+    
+    def test_help(self):
+        self._hold(fcntl.LOCK_EX)
+        self.assertEqual(self._start('make', '--help'), 0)
+        self.assertRaises(subprocess.TimeoutExpired, self._start, 'set'
+         , 'mod.X=1', timeout=0.5)
+    
+    def test_shared(self):
+        self._hold(fcntl.LOCK_SH)
+        self.assertEqual(self._start('status'), 0)
+
+
+if __name__ == '__main__':
+    base = split(abspath(sys.argv[0]))[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pconfig
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import os
+import sys
+import time
+import json
+import shutil
+import socket
+import tempfile
+import unittest
+import warnings
+import threading
+import contextlib
+
+class _WatcherTests(object):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+        self._src = join(self._tmp, 'src')
+        os.makedirs(join(self._src, 'mod'))
+        os.mkdir(join(self._tmp, 'cfg'))
+        self._write(join('src', 'mod', 'a.txt'), 'a')
+        self._config = join(self._tmp, 'cfg', 'config.jso')
+        self._watcher = self._create([self._src], [self._config]
+         , exclude=[join(self._src, 'out')])
+    
+    def _write(self, relpath, data):
+        path = join(self._tmp, relpath)
+        with open(path, 'w') as f:
+            f.write(data)
+        # Makes sure that the polling watcher sees the change.
+        os.utime(path, ns=(0, time.time_ns() + 1000000000))
+        return path
+    
+    def test_changes(self):
+        a = self._write(join('src', 'mod', 'a.txt'), 'b')
+        cfg = self._write(join('cfg', 'config.jso'), '{}')
+        self._write(join('cfg', 'other.jso'), '{}')
+        self.assertEqual(self._watcher.changes(), {a, cfg})
+        self.assertEqual(self._watcher.changes(), set())
+    
+    def test_new_directory(self):
+        os.mkdir(join(self._src, 'out'))
+        self._write(join('src', 'out', 'x.txt'), 'x')
+        os.mkdir(join(self._src, 'new'))
+        new = self._write(join('src', 'new', 'b.txt'), 'b')
+        changes = self._watcher.changes()
+        self.assertIn(new, changes)
+        self.assertNotIn(join(self._src, 'out', 'x.txt'), changes)
+        os.remove(new)
+        self.assertIn(new, self._watcher.changes())
+    
+    def tearDown(self):
+        self._watcher.close()
+
+
+class TestPollingWatcher(_WatcherTests, unittest.TestCase):
+    
+    def _create(self, roots, files, exclude):
+        return pdaemon.PollingWatcher(roots, files, exclude=exclude)
+
+
+class TestInotifyWatcher(_WatcherTests, unittest.TestCase):
+    
+    def _create(self, roots, files, exclude):
+        try:
+            return pdaemon.InotifyWatcher(roots, files, exclude=exclude)
+        except OSError as e:
+            self.skipTest(str(e))
+
+
+class _Watcher(object):
+    
+    def __init__(self, *pending):
+        self.pending = list(pending)
+    
+    def fileno(self):
+        return None
+    
+    def timeout(self):
+        return 0.01
+    
+    def changes(self):
+        if len(self.pending) > 0:
+            return self.pending.pop(0)
+        return set()
+    
+    def close(self):
+        pass
+
+
+class _ServerTests(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+        self._src = join(self._tmp, 'src')
+        self._write('a', "cfg.input('X')\n")
+        self._write('b', "#$ use A\n")
+        self._write('c', "")
+        self._config = join(self._tmp, 'config.jso')
+        self._main = join(self._tmp, 'main.jso')
+        self._sock = join(self._tmp, 'daemon.sock')
+        pfile.saveConfigFile(self._config, {'A' : {'X' : 'x'}})
+        self.loads = 0
+        self.builds = list()
+    
+    def _write(self, name, data):
+        os.makedirs(join(self._src, name), exist_ok=True)
+        path = join(self._src, name, 'configure_%s.py' % name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+    
+    def _load(self):
+        self.loads += 1
+        man = pmodules.ModuleManager(self._src)
+        man.initModules(targets.TargetTree(self._src))
+        return man
+    
+    def _build(self, man):
+        self.builds.append(man.getModule('A').getConfigDict())
+        return 1
+    
+    def _server(self, watcher=None, auto=False):
+        with contextlib.redirect_stdout(None):
+            return pdaemon.BuildServer(self._load, self._build
+             , self._config, self._main, self._sock
+             , watcher or _Watcher(), auto=auto)
+
+
+class TestBuildServer(_ServerTests):
+    
+    def setUp(self):
+        super().setUp()
+        self._both = pdaemon.BuildServer.RELOADED \
+         | pdaemon.BuildServer.CHANGED
+        self._server = self._server()
+    
+    def _changes(self, *paths):
+        with contextlib.redirect_stdout(None):
+            return self._server.handleChanges(set(paths))
+    
+    def test_script_change(self):
+        man = self._server._man
+        path = self._write('c', "cfg.input('Z')\n")
+        self.assertEqual(self._changes(path), self._both)
+        self.assertEqual(self.loads, 1)
+        self.assertIs(self._server._man, man)
+        man.getModule('C').getNode('Z')
+        other = join(self._src, 'c', 'other.txt')
+        self.assertEqual(self._changes(other), pdaemon.BuildServer.CHANGED)
+        self.assertEqual(self._changes(other, self._config)
+         , pdaemon.BuildServer.CHANGED)
+        self.assertEqual(self.loads, 1)
+    
+    def test_extension_change(self):
+        self.assertEqual(self._changes(self._write('c', "#$ use A\n"))
+         , self._both)
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self._changes(self._write('d', "")), self._both)
+        self.assertEqual(self.loads, 3)
+        self.assertEqual(len(self._server._man.getModuleNames()), 4)
+    
+    def test_config_change(self):
+        self.assertEqual(self._changes(self._config), 0)
+        pfile.saveConfigFile(self._config, {'A' : {'X' : 'y'}})
+        self.assertEqual(self._changes(self._config), self._both)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self._server.build(), (True, "1 file(s) written."))
+        self.assertEqual(self.builds, [{'X' : 'y'}])
+    
+    def test_main_change(self):
+        self.assertEqual(self._changes(self._main), self._both)
+        self.assertEqual(self.loads, 2)
+        with contextlib.redirect_stdout(None):
+            self.assertEqual(self._server.handleChanges(None), self._both)
+        self.assertEqual(self.loads, 3)
+    
+    def test_not_configured(self):
+        pfile.saveConfigFile(self._config, {})
+        self._changes(self._config)
+        with contextlib.redirect_stdout(None), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.assertFalse(self._server.build()[0])
+        self.assertEqual(self.builds, [])
+
+
+class TestServerSocket(_ServerTests):
+    
+    def _start(self, watcher=None, auto=False):
+        server = self._server(watcher, auto)
+        thread = threading.Thread(target=server.serveForever, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            try:
+                pdaemon.sendCommand(self._sock, pdaemon.CMD_STATUS)
+                break
+            except OSError:
+                time.sleep(0.01)
+        return thread
+    
+    def test_commands(self):
+        thread = self._start()
+        try:
+            self.assertEqual(pdaemon.sendCommand(self._sock
+             , pdaemon.CMD_STATUS), {'ok' : True
+             , 'message' : "3 module(s), 0 build(s)."})
+            self.assertEqual(pdaemon.sendCommand(self._sock
+             , pdaemon.CMD_BUILD), {'ok' : True
+             , 'message' : "1 file(s) written."})
+            self.assertEqual(pdaemon.sendCommand(self._sock
+             , pdaemon.CMD_STATUS)['message'], "3 module(s), 1 build(s).")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self._sock)
+                sock.sendall(b'invalid\n')
+                response = json.loads(sock.makefile().readline())
+            self.assertEqual(response, {'ok' : False
+             , 'message' : "Invalid request."})
+            self.assertRaises(pdaemon.DaemonError
+             , self._server().serveForever)
+        finally:
+            response = pdaemon.sendCommand(self._sock, pdaemon.CMD_STOP)
+            thread.join()
+        self.assertEqual(response, {'ok' : True, 'message' : "Stopped."})
+        self.assertFalse(os.path.exists(self._sock))
+        self.assertEqual(self.builds, [{'X' : 'x'}])
+    
+    def test_watch(self):
+        # A template has changed (no module has to be reloaded).
+        watcher = _Watcher(set(), {join(self._src, 'a', 't.txt')})
+        thread = self._start(watcher, auto=True)
+        deadline = time.time() + 10
+        while (len(watcher.pending) > 0 or len(self.builds) < 2) \
+         and time.time() < deadline:
+            time.sleep(0.01)
+        pdaemon.sendCommand(self._sock, pdaemon.CMD_STOP)
+        thread.join()
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.builds, [{'X' : 'x'}, {'X' : 'x'}])
+    
+    def test_stale_socket(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self._sock)
+        self.assertRaises(OSError, pdaemon.sendCommand, self._sock
+         , pdaemon.CMD_STATUS)
+        thread = self._start()
+        self.assertTrue(pdaemon.sendCommand(self._sock
+         , pdaemon.CMD_STOP)['ok'])
+        thread.join()
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pdaemon
+    import pmodules
+    import targets
+    import pfile
+    unittest.main()
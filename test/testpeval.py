@@ -2,7 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from os.path import split, join, normpath
+import os
+import io
 import sys
+import pickle
+import hashlib
+import shutil
+import tempfile
 import unittest
 
 class TestExecEnvironment(unittest.TestCase):
@@ -44,9 +50,185 @@ class TestExecEnvironment(unittest.TestCase):
         self._eval = None
 
 
+class TestPyParser(unittest.TestCase):
+    
+    def _render(self, template, env):
+        out = io.StringIO()
+        PyParser(out, env, name='test').parseTemplate(template)
+        return out.getvalue()
+    
+    def test_template(self):
+        data = "a <?py:echo(A)?> b\n<?py:put(A + 1)?>c"
+        template = PyParser(None, dict()).compileString(data)
+        self.assertEqual(self._render(template, {'A' : 1}), "a 1 b\n2\nc")
+        self.assertEqual(self._render(template, {'A' : 5}), "a 5 b\n6\nc")
+    
+    def test_template_error_line(self):
+        data = "line 1\nline 2 <?py:\nx = 1\nfail()\n?>\n"
+        template = PyParser(None, dict()).compileString(data)
+        try:
+            self._render(template, dict())
+            self.fail("CodeEvalError expected")
+        except CodeEvalError as e:
+            self.assertEqual(e.line, 4)
+    
+    def test_template_syntax_error_line(self):
+        data = "line 1\n<?py:echo(1)?>\n<?py:\nx = = 1\n?>\n"
+        try:
+            PyParser(None, dict()).compileString(data)
+            self.fail("CodeEvalError expected")
+        except CodeEvalError as e:
+            self.assertEqual(e.line, 4)
+    
+    def test_template_dumps(self):
+        data = "a <?py:echo(A)?> b"
+        template = PyParser(None, dict()).compileString(data)
+        template = Template.loads(template.dumps())
+        self.assertEqual(self._render(template, {'A' : 2}), "a 2 b")
+        self.assertTrue(Template.loads(b'invalid') is None)
+    
+    def test_unknown_tag(self):
+        out = io.StringIO()
+        data = '<?xml version="1.0"?>\n<a><?py:echo(A)?></a>'
+        PyParser(out, {'A' : 1}).parseString(data)
+        self.assertEqual(out.getvalue(), '<?xml version="1.0"?>\n<a>1</a>')
+    
+    def test_missing_closing_tag(self):
+        data = "a\n<?py:echo(1)?>\nb\n<?py:echo(2)\n"
+        try:
+            PyParser(io.StringIO(), dict()).parseString(data)
+            self.fail("MissingClosingTagError expected")
+        except MissingClosingTagError as e:
+            self.assertEqual(e.line, 4)
+    
+    def test_parse_stream(self):
+        data = ('<?xml version="1.0"?>\n<a><?py:echo(A)?></a>\n'
+         + "<? py:\nfor i in range(3):\n    put(i)\n?>end<")
+        expected = io.StringIO()
+        PyParser(expected, {'A' : 1}).parseString(data)
+        for size in range(1, len(data) + 1):
+            out = io.StringIO()
+            PyParser(out, {'A' : 1}).parseStream(io.StringIO(data)
+             , chunk_size=size)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+    
+    def test_parse_stream_error_line(self):
+        data = "line 1\nline 2 <?py:\nx = 1\nfail()\n?>\n"
+        for size in (1, 5, 100):
+            try:
+                PyParser(io.StringIO(), dict()).parseStream(
+                    io.StringIO(data), chunk_size=size)
+                self.fail("CodeEvalError expected")
+            except CodeEvalError as e:
+                self.assertEqual(e.line, 4)
+        block = "<?py:\nn += 1\nif n > 1:\n    fail()\n?>\n"
+        try:
+            PyParser(io.StringIO(), {'n' : 0}).parseStream(
+                io.StringIO(block + "\n" + block), chunk_size=7)
+            self.fail("CodeEvalError expected")
+        except CodeEvalError as e:
+            self.assertEqual(e.line, 10)
+        try:
+            PyParser(io.StringIO(), dict()).parseStream(
+                io.StringIO("a\n<?py:echo(1)?>\nb\n<?py:echo(2)\n")
+                , chunk_size=3)
+            self.fail("MissingClosingTagError expected")
+        except MissingClosingTagError as e:
+            self.assertEqual(e.line, 4)
+    
+    def test_buffered(self):
+        
+        class _Stream(io.StringIO):
+            flushed = 0
+            def flush(self):
+                self.flushed += 1
+        
+        data = "<?py:\nfor i in range(10):\n    put(i)\n?>"
+        env = {'__builtins__' : __builtins__}
+        out = _Stream()
+        PyParser(out, dict(env)).parseString(data)
+        self.assertEqual(out.flushed, 11)
+        buffered = _Stream()
+        PyParser(buffered, dict(env), buffered=True).parseString(data)
+        self.assertEqual(buffered.flushed, 1)
+        self.assertEqual(buffered.getvalue(), out.getvalue())
+    
+    def test_error_pickle(self):
+        try:
+            PyParser(io.StringIO(), dict(), name='test').parseString(
+                "a\n<?py:fail()?>")
+            self.fail("CodeEvalError expected")
+        except CodeEvalError as e:
+            e = pickle.loads(pickle.dumps(e))
+            self.assertEqual((e.name, e.line), ('test', 2))
+    
+    def test_template_cache(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = join(tmp, 'target.c')
+            with open(path, 'w') as f:
+                f.write("int a = <?py:echo(A)?>;")
+            cache_dir = join(tmp, 'cache')
+            TemplateCache(cache_dir).get(path)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            template = TemplateCache(cache_dir).get(path)
+            self.assertEqual(self._render(template, {'A' : 3})
+             , "int a = 3;")
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            os.remove(path)
+            template = TemplateCache(cache_dir).get(path, digest=digest)
+            self.assertEqual(self._render(template, {'A' : 4})
+             , "int a = 4;")
+        finally:
+            shutil.rmtree(tmp)
+    
+    def test_template_changed(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = join(tmp, 'target.c')
+            with open(path, 'w') as f:
+                f.write("a = <?py:echo(A)?>;")
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            # Edited after the hash has been calculated.
+            with open(path, 'w') as f:
+                f.write("b = <?py:echo(A)?>;")
+            cache_dir = join(tmp, 'cache')
+            template = TemplateCache(cache_dir).get(path, digest=digest)
+            self.assertEqual(self._render(template, {'A' : 1}), "b = 1;")
+            with open(path, 'w') as f:
+                f.write("a = <?py:echo(A)?>;")
+            template = TemplateCache(cache_dir).get(path, digest=digest)
+            self.assertEqual(self._render(template, {'A' : 1}), "a = 1;")
+        finally:
+            shutil.rmtree(tmp)
+    
+    def test_code_cache(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = join(tmp, 'configure_a.py')
+            with open(path, 'w') as f:
+                f.write("a = 1\n")
+            cache_dir = join(tmp, 'cache')
+            env = ExecEnvironment(dict(), name=path)
+            env.execute(CodeCache(cache_dir).get(path, env))
+            self.assertEqual(env.env['a'], 1)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            with open(path, 'w') as f:
+                f.write("a = 22\n")
+            env.execute(CodeCache(cache_dir).get(path, env))
+            self.assertEqual(env.env['a'], 22)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+        finally:
+            shutil.rmtree(tmp)
+
+
 if __name__ == '__main__':
     base = split(sys.argv[0])[0]
     path = normpath(join(base, "../src/"))
     sys.path.insert(0, path)
     from peval import ExecEnvironment, CodeEvalError
+    from peval import PyParser, Template, TemplateCache, CodeCache
+    from peval import MissingClosingTagError
     unittest.main()
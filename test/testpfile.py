@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_CONFIG = {'MOD' : {'A' : 1, 'B' : [1.5, None, True], 'C' : 'text ä'}}
+
+
+class TestConfigFile(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self._path = join(self._tmp, 'config.jso')
+    
+    def test_json(self):
+        pfile.saveConfigFile(self._path, _CONFIG)
+        self.assertEqual(pfile.fileFormat(self._path), pfile.FORMAT_JSON)
+        self.assertEqual(pfile.loadConfigFile(self._path), _CONFIG)
+    
+    def test_snapshot(self):
+        pfile.saveConfigFile(self._path, _CONFIG, fmt=pfile.FORMAT_SNAPSHOT)
+        self.assertEqual(pfile.fileFormat(self._path)
+         , pfile.FORMAT_SNAPSHOT)
+        self.assertEqual(pfile.loadConfigFile(self._path), _CONFIG)
+        pfile.saveConfigFile(self._path, {'MOD' : {}})
+        self.assertEqual(pfile.fileFormat(self._path)
+         , pfile.FORMAT_SNAPSHOT)
+        self.assertEqual(pfile.loadConfigFile(self._path), {'MOD' : {}})
+    
+    def test_snapshot_types(self):
+        objs = {'A' : (1, [2.5, (None,)]), 'B' : {1 : True, None : 'x'}}
+        expected = json.loads(json.dumps(objs))
+        for fmt in pfile.FORMATS:
+            self.assertEqual(pfile.loads(pfile.dumps(objs, fmt)), expected)
+            self.assertRaises(TypeError, pfile.dumps, {'A' : {1}}, fmt)
+            self.assertRaises(TypeError, pfile.dumps, [b'x'], fmt)
+        data = pfile.dumps(_CONFIG, pfile.FORMAT_SNAPSHOT)
+        self.assertEqual(json.loads(json.dumps(pfile.loads(data)))
+         , _CONFIG)
+    
+    def test_invalid_snapshot(self):
+        data = pfile.dumps(_CONFIG, pfile.FORMAT_SNAPSHOT)
+        version = len(b'PBSNAP')
+        data = data[:version] + b'\xff' + data[version + 1:]
+        self.assertRaises(ValueError, pfile.loads, data)
+        self.assertRaises(ValueError, pfile.loads, b'PBSNAP')
+    
+    def test_atomic(self):
+        pfile.saveConfigFile(self._path, _CONFIG)
+        self.assertRaises(TypeError, pfile.saveConfigFile, self._path
+         , {'MOD' : set()})
+        self.assertRaises(TypeError, pfile.writeFile, self._path, None)
+        self.assertEqual(pfile.loadConfigFile(self._path), _CONFIG)
+        self.assertEqual(os.listdir(self._tmp), ['config.jso'])
+    
+    def test_compare(self):
+        self.assertTrue(pfile.writeFile(self._path, b'data', sync=False))
+        mtime = os.stat(self._path).st_mtime_ns
+        self.assertFalse(pfile.writeFile(self._path
+         , lambda f: f.write(b'data'), compare=True))
+        self.assertEqual(os.stat(self._path).st_mtime_ns, mtime)
+        self.assertTrue(pfile.writeFile(self._path, b'new', compare=True))
+        self.assertEqual(os.listdir(self._tmp), ['config.jso'])
+    
+    def test_backups(self):
+        for i in range(4):
+            pfile.saveConfigFile(self._path, {'i' : i}, backups=2)
+        self.assertEqual(sorted(os.listdir(self._tmp))
+         , ['config.jso', 'config.jso.1.bak', 'config.jso.2.bak'])
+        self.assertEqual(pfile.loadConfigFile(self._path), {'i' : 3})
+        self.assertEqual(pfile.loadConfigFile(self._path + '.1.bak')
+         , {'i' : 2})
+        self.assertEqual(pfile.loadConfigFile(self._path + '.2.bak')
+         , {'i' : 1})
+    
+    def test_mode(self):
+        pfile.saveConfigFile(self._path, _CONFIG)
+        os.chmod(self._path, 0o600)
+        pfile.saveConfigFile(self._path, {}, backups=1)
+        self.assertEqual(os.stat(self._path).st_mode & 0o777, 0o600)
+        self.assertEqual(pfile.loadConfigFile(self._path), {})
+    
+    @unittest.skipIf(not hasattr(os, 'symlink'), "no symbolic links")
+    def test_symlink(self):
+        link = join(self._tmp, 'link.jso')
+        pfile.saveConfigFile(self._path, _CONFIG)
+        os.symlink('config.jso', link)
+        pfile.saveConfigFile(link, {}, backups=1)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(pfile.loadConfigFile(self._path), {})
+        self.assertEqual(pfile.loadConfigFile(self._path + '.1.bak')
+         , _CONFIG)
+    
+    @unittest.skipIf(fcntl is None, "fcntl isn't available")
+    def test_lock(self):
+        path = join(self._tmp, 'lock')
+        waiting = list()
+        with pfile.FileLock(path):
+            with open(path, 'rb') as f:
+                self.assertRaises(BlockingIOError, fcntl.flock, f.fileno()
+                 , fcntl.LOCK_SH | fcntl.LOCK_NB)
+        with pfile.FileLock(path, shared=True):
+            with pfile.FileLock(path, shared=True, waiting=waiting.append):
+                pass
+        self.assertEqual(waiting, [])
+        with open(path, 'rb') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    
+    def test_missing_lock_file(self):
+        path = join(self._tmp, 'missing', 'lock')
+        with pfile.FileLock(path, shared=True):
+            pass
+        self.assertRaises(OSError, pfile.FileLock(path).acquire)
+    
+    def tearDown(self):
+        shutil.rmtree(self._tmp)
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pfile
+    unittest.main()
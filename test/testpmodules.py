@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+class TestDiscoveryIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self._src = join(self._tmp, 'src')
+        os.makedirs(join(self._src, 'mod', 'sub'))
+        with open(join(self._src, 'mod', 'configure_mod.py'), 'w') as f:
+            f.write("")
+    
+    def test_scan(self):
+        index = pmodules.DiscoveryIndex(self._src)
+        self.assertEqual(index.scan(self._src, '.'), ([], ['mod']))
+        self.assertEqual(index.scan(join(self._src, 'mod'), 'mod')
+         , (['configure_mod.py'], ['sub']))
+    
+    def test_save_load(self):
+        path = join(self._tmp, 'cache', 'discovery.jso')
+        mod_path = join(self._src, 'mod')
+        index = pmodules.DiscoveryIndex(self._src)
+        index.scan(mod_path, 'mod')
+        index.save(path)
+        
+        mtime = os.stat(mod_path).st_mtime_ns
+        os.mkdir(join(mod_path, 'other'))
+        os.utime(mod_path, ns=(mtime, mtime))
+        index = pmodules.DiscoveryIndex.load(path, self._src)
+        self.assertEqual(index.scan(mod_path, 'mod')[1], ['sub'])
+        
+        os.utime(mod_path, ns=(mtime + 1, mtime + 1))
+        self.assertEqual(index.scan(mod_path, 'mod')[1], ['other', 'sub'])
+        
+        index = pmodules.DiscoveryIndex.load(path, self._tmp)
+        self.assertEqual(index.scan(mod_path, 'mod')[1], ['other', 'sub'])
+    
+    def tearDown(self):
+        shutil.rmtree(self._tmp)
+
+
+class _ScriptObj(object):
+    
+    def __init__(self, frames):
+        self.frames = frames
+
+
+class _RestlessFrame(object):
+    """Frame that always wants to be executed again."""
+    
+    def __init__(self):
+        self.runs = 0
+    
+    def getName(self):
+        return None
+    
+    def iterDependencies(self):
+        return iter(())
+    
+    def iterNodes(self):
+        return iter(())
+    
+    def iterSubFrames(self):
+        return iter(())
+    
+    def isRemoved(self):
+        return False
+    
+    def canExecute(self):
+        return True
+    
+    def executeFunction(self, csf):
+        self.runs += 1
+
+
+class TestFrameScheduler(unittest.TestCase):
+    
+    def _frame(self, deps, creates):
+        frame = pmodules.DependencyFrame(deps)
+        for node in creates:
+            frame.addNode(node.getName(), node)
+        return frame
+    
+    def test_order(self):
+        (a, b, c) = [pmodules.ConstValue(i, 1) for i in 'abc']
+        f3 = self._frame([b], [c])
+        f2 = self._frame([a], [b])
+        f1 = self._frame([], [a])
+        f2.addSubFrame(f3)
+        csf = _ScriptObj([f3, f2, f1])
+        scheduler = pmodules.FrameScheduler()
+        order = [i[1] for i in scheduler.order([csf])]
+        self.assertEqual(order, [f1, f2, f3])
+        self.assertEqual(scheduler.cycles, [])
+    
+    def test_cycle(self):
+        (a, b, c) = [pmodules.ConstValue(i, 1) for i in 'abc']
+        f1 = self._frame([b], [a])
+        f2 = self._frame([a], [b])
+        f3 = self._frame([b], [c])
+        f4 = self._frame([], [])
+        csf = _ScriptObj([f1, f2, f3, f4])
+        scheduler = pmodules.FrameScheduler()
+        with self.assertLogs('modules', 'WARNING') as logs:
+            order = [i[1] for i in scheduler.order([csf])]
+        self.assertEqual(order, [f4, f1, f2, f3])
+        self.assertEqual(scheduler.cycles, [[f1, f2, f1]])
+        self.assertNotIn('None', logs.output[0])
+        self.assertIn(repr(f2), logs.output[0])
+        f1(lambda : None)
+        self.assertEqual(pmodules._frame_label(f1), '<lambda>')
+    
+    def test_not_settled(self):
+        frames = [_RestlessFrame(), _RestlessFrame()]
+        scheduler = pmodules.FrameScheduler(max_rounds=3)
+        with self.assertLogs('modules', 'ERROR') as logs:
+            with self.assertRaises(pmodules.FramesNotSettledError) as cm:
+                scheduler.run([_ScriptObj(frames)])
+        self.assertEqual(cm.exception.frames, frames)
+        self.assertEqual(cm.exception.cycles, [])
+        self.assertEqual([i.runs for i in frames], [3, 3])
+        self.assertIn(repr(frames[1]), logs.output[0])
+
+
+class _Seeker(object):
+    
+    def __init__(self, log=None):
+        self.updates = 0
+        self.log = log
+    
+    def update(self):
+        self.updates += 1
+        if self.log is not None:
+            self.log.append(self)
+
+
+class TestChangePropagator(unittest.TestCase):
+    
+    def test_transaction(self):
+        node = pmodules.InputChoice('a')
+        seeker = _Seeker()
+        node.addInfoSeeker(seeker)
+        node.setValue('x')
+        self.assertEqual(seeker.updates, 1)
+        with pmodules.transaction():
+            node.setValue('y')
+            node.setValue('z')
+            self.assertEqual(seeker.updates, 1)
+        self.assertEqual(seeker.updates, 2)
+    
+    def test_order(self):
+        log = list()
+        src = pmodules.InputChoice('src')
+        ovr = pmodules.InputChoice('ovr')
+        ovr.registerOverride(src)
+        first = _Seeker(log)
+        last = _Seeker(log)
+        ovr.addInfoSeeker(last)
+        src.addInfoSeeker(first)
+        with pmodules.transaction():
+            src.setValue('x')
+        self.assertEqual(ovr.readValue(), 'x')
+        self.assertEqual(log, [first, last])
+
+
+class TestChangeListener(unittest.TestCase):
+    
+    def setUp(self):
+        self.events = list()
+        pmodules.addChangeListener(self._listener)
+    
+    def _listener(self, nodes, modules):
+        self.events.append((nodes, modules))
+    
+    def test_listener(self):
+        src = pmodules.InputChoice('src')
+        ovr = pmodules.InputChoice('ovr')
+        other = pmodules.InputChoice('other')
+        ovr.registerOverride(src)
+        with pmodules.transaction():
+            src.setValue('x')
+            self.assertEqual(self.events, [])
+        self.assertEqual(self.events, [({src, ovr}, set())])
+        other.setValue('y')
+        self.assertEqual(self.events[1], ({other}, set()))
+    
+    def tearDown(self):
+        pmodules.removeChangeListener(self._listener)
+
+
+class _Module(object):
+    
+    def __init__(self, *nodes):
+        self._nodes = dict((i.getName(), i) for i in nodes)
+    
+    def getNode(self, name):
+        return self._nodes[name]
+
+
+class TestIsDisabled(unittest.TestCase):
+    
+    def test_flags(self):
+        flag = pmodules.InputChoice('flag')
+        node = pmodules.InputChoice('node', flags=['flag'])
+        node.resolveFlags(_Module(flag))
+        self.assertTrue(node.isDisabled())
+        flag.setValue(True)
+        self.assertFalse(node.isDisabled())
+        with pmodules.transaction():
+            flag.setValue(False)
+            self.assertTrue(node.isDisabled())
+        self.assertTrue(node.isDisabled())
+    
+    def test_override(self):
+        src = pmodules.InputChoice('src')
+        flag = pmodules.InputChoice('flag')
+        node = pmodules.InputChoice('node', flags=['flag'])
+        node.resolveFlags(_Module(flag))
+        flag.registerOverride(src)
+        self.assertTrue(node.isDisabled())
+        src.setValue(True)
+        self.assertFalse(node.isDisabled())
+
+
+class TestListChoice(unittest.TestCase):
+    
+    def test_index(self):
+        node = pmodules.ListChoice('a', list(range(20000)) + [5])
+        node.setValue(19999)
+        self.assertEqual(node.getIndex(), 19999)
+        self.assertFalse(node.setValue(20000))
+        node.chooseByIndex(20000)
+        self.assertEqual(node.getIndex(), 5)
+    
+    def test_unhashable(self):
+        node = pmodules.MultiChoice('a', [1, [2], (3,), 1.5])
+        self.assertTrue(node.setValue([[2], 1]))
+        self.assertEqual(node.getIndices(), [1, 0])
+        self.assertFalse(node.setValue([[4]]))
+        self.assertTrue(node.setValue([(3,), 1.5]))
+        self.assertEqual(node.getIndices(), [2, 3])
+
+
+class TestConfigDict(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self._write('a', "cfg.input('X', type='cstr')\n")
+        self._write('b', "#$ use A\ncfg.input('Y')\n")
+        self._write('c', "#$ use A\n")
+        man = pmodules.ModuleManager(self._tmp)
+        man.initModules(targets.TargetTree(self._tmp))
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                man.loadNodes({'A' : {'X' : 'x'}, 'B' : {'Y' : 'y'}})
+        self._man = man
+    
+    def _write(self, name, data):
+        os.mkdir(join(self._tmp, name))
+        path = join(self._tmp, name, 'configure_%s.py' % name)
+        with open(path, 'w') as f:
+            f.write(data)
+    
+    def test_cache(self):
+        (a, b, c) = [self._man.getModule(i) for i in 'ABC']
+        self.assertEqual(b.getConfigDict(formatted=True, inc_used=True)
+         , {'A_X' : '"x"', 'B_Y' : 'y'})
+        self.assertIs(b._cached_dict(True, True)
+         , b._cached_dict(True, True))
+        c.getConfigDict(formatted=True, inc_used=True)
+        self.assertIs(a._cached_dict(True, True)
+         , a._cached_dict(True, True))
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                a.getNode('X').setValue('z')
+        self.assertEqual(b.getConfigDict(formatted=True, inc_used=True)
+         , {'A_X' : '"z"', 'B_Y' : 'y'})
+        self.assertEqual(a.getConfigDict(), {'X' : 'z'})
+    
+    def test_reload(self):
+        self._write('d', "cfg.input('W')\n")
+        man = pmodules.ModuleManager(self._tmp)
+        man.initModules(targets.TargetTree(self._tmp))
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                man.loadNodes({'D' : {'W' : 'w'}})
+                d = man.getModule('D')
+                node = d.getNode('W')
+                self.assertEqual(man.reloadModules(['B']), {'A', 'B', 'C'})
+                self.assertIs(d.getNode('W'), node)
+                self.assertEqual(man.reloadModules(['D']
+                 , config={'D' : {'W' : 'v'}}), {'D'})
+        self.assertEqual(d.getConfigDict(), {'W' : 'v'})
+        self.assertFalse(d.extensionsChanged())
+        with open(d.scriptPath(), 'w') as f:
+            f.write("#$ use A\n")
+        self.assertTrue(d.extensionsChanged())
+    
+    def tearDown(self):
+        shutil.rmtree(self._tmp)
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import pmodules
+    import targets
+    unittest.main()
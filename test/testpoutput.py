@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from os.path import split, join, normpath
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+class TestSyncTree(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self._src = join(self._tmp, 'src')
+        self._dst = join(self._tmp, 'out')
+        os.makedirs(join(self._src, 'mod'))
+        self._write('plain.txt', 'plain')
+        self._write(join('mod', 'target.c'), 'target')
+        self._tgets = {join('mod', 'target.c') : 'cfg1'}
+    
+    def _write(self, relpath, data):
+        with open(join(self._src, relpath), 'w') as f:
+            f.write(data)
+    
+    def _sync(self, manifest, link=None):
+        render = poutput.syncTree(self._src, self._dst, self._tgets
+         , manifest, link=link)
+        for (relpath, src_hash) in render:
+            with open(join(self._src, relpath), 'r') as f:
+                poutput.replaceFile(join(self._dst, relpath), f.read())
+            manifest.setTarget(relpath, src_hash, self._tgets[relpath])
+        return [i[0] for i in render]
+    
+    def test_unchanged(self):
+        manifest = poutput.BuildManifest(self._dst)
+        self.assertEqual(self._sync(manifest), [join('mod', 'target.c')])
+        self.assertTrue(os.path.isfile(join(self._dst, 'plain.txt')))
+        self.assertEqual(self._sync(manifest), [])
+    
+    def test_config_changed(self):
+        manifest = poutput.BuildManifest(self._dst)
+        self._sync(manifest)
+        self._tgets[join('mod', 'target.c')] = 'cfg2'
+        self.assertEqual(self._sync(manifest), [join('mod', 'target.c')])
+    
+    def test_save_load(self):
+        manifest = poutput.BuildManifest(self._dst)
+        self._sync(manifest)
+        path = join(self._tmp, 'manifest.jso')
+        manifest.save(path)
+        manifest = poutput.BuildManifest.load(path, self._dst)
+        self.assertEqual(self._sync(manifest), [])
+        manifest = poutput.BuildManifest.load(path, self._src)
+        self.assertEqual(self._sync(manifest), [join('mod', 'target.c')])
+    
+    def test_stale(self):
+        manifest = poutput.BuildManifest(self._dst)
+        self._sync(manifest)
+        os.remove(join(self._src, 'plain.txt'))
+        self._sync(manifest)
+        self.assertFalse(os.path.exists(join(self._dst, 'plain.txt')))
+    
+    def test_hardlink(self):
+        manifest = poutput.BuildManifest(self._dst)
+        self._sync(manifest, link=poutput.LINK_HARD)
+        src_path = join(self._src, 'plain.txt')
+        dst_path = join(self._dst, 'plain.txt')
+        self.assertTrue(os.path.samefile(src_path, dst_path))
+        tget_path = join(self._dst, 'mod', 'target.c')
+        self.assertEqual(os.stat(tget_path).st_nlink, 1)
+    
+    def test_place_replaces_link(self):
+        src_path = join(self._src, 'plain.txt')
+        dst_path = join(self._tmp, 'linked.txt')
+        os.link(src_path, dst_path)
+        poutput.placeFile(join(self._src, 'mod', 'target.c'), dst_path)
+        with open(src_path, 'r') as f:
+            self.assertEqual(f.read(), 'plain')
+    
+    def test_replace_file(self):
+        path = join(self._tmp, 'out.txt')
+        self.assertTrue(poutput.replaceFile(path, 'content'))
+        os.utime(path, ns=(0, 0))
+        self.assertFalse(poutput.replaceFile(path, 'content'))
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+        self.assertTrue(poutput.replaceFile(path, 'other'))
+        with open(path, 'r') as f:
+            self.assertEqual(f.read(), 'other')
+        tmp_files = [i for i in os.listdir(self._tmp) if i.endswith('.tmp')]
+        self.assertEqual(tmp_files, [])
+    
+    def test_replace_file_stream(self):
+        path = join(self._tmp, 'out.txt')
+        write = lambda f: f.write('content\n' * 1000)
+        self.assertTrue(poutput.replaceFileStream(path, write))
+        os.utime(path, ns=(0, 0))
+        self.assertFalse(poutput.replaceFile(path, 'content\n' * 1000))
+        self.assertFalse(poutput.replaceFileStream(path, write))
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+        self.assertTrue(poutput.replaceFileStream(path
+         , lambda f: f.write('other')))
+        with open(path, 'r') as f:
+            self.assertEqual(f.read(), 'other')
+        tmp_files = [i for i in os.listdir(self._tmp) if i.endswith('.tmp')]
+        self.assertEqual(tmp_files, [])
+    
+    def tearDown(self):
+        shutil.rmtree(self._tmp)
+
+
+if __name__ == '__main__':
+    base = split(sys.argv[0])[0]
+    path = normpath(join(base, "../src/"))
+    sys.path.insert(0, path)
+    import poutput
+    unittest.main()